@@ -1,18 +1,45 @@
-from fastapi import FastAPI, HTTPException, status, Depends
+from fastapi import (
+    FastAPI,
+    HTTPException,
+    status,
+    Depends,
+    File,
+    Form,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+)
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import APIKeyHeader
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
+import hmac
+import orjson
 import logging
 import os
+import json
+import time
+import asyncio
 from datetime import datetime
 
 from embeddings import ImageEmbedder
+from shards import ShardedIndex
 from config import get_config
+from logging_config import sample_request, setup_logging
+from popular_queries import PrecomputedResults, QueryLog
+from metrics import (
+    HTTP_REQUEST_SECONDS,
+    SEARCH_STAGE_SECONDS,
+    render_metrics,
+    server_timing_header,
+    start_request_timings,
+    timed,
+)
 
 config = get_config()
 
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Vinted Fashion Recommender API", version="1.0.0")
@@ -29,6 +56,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_timings(request: Request, call_next):
+    """Time every request; optionally expose stages in a Server-Timing header"""
+    timings = start_request_timings() if config["timing_headers"] else None
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+
+    # Label by route template so item IDs do not explode cardinality
+    route = request.scope.get("route")
+    path = getattr(route, "path", "unmatched")
+    HTTP_REQUEST_SECONDS.labels(path=path).observe(elapsed)
+
+    if timings is not None:
+        timings["total"] = elapsed
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+
 # API Key Authentication
 _raw_api_key = os.getenv("API_KEY", "dev-secret-key")
 
@@ -45,11 +91,12 @@ logger.info(
     API_KEY[:3],
     len(API_KEY),
 )
+API_KEY_BYTES = API_KEY.encode()
 API_KEY_NAME = "x-api-key"
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
 
 async def verify_api_key(api_key: str = Depends(api_key_header)):
-    """Validate API key from header, with detailed logging."""
+    """Validate API key from header; only failures are logged."""
     if api_key is None:
         logger.warning("Missing API key header.")
         raise HTTPException(
@@ -57,7 +104,7 @@ async def verify_api_key(api_key: str = Depends(api_key_header)):
 
             detail="Missing API key",
         )
-    if api_key != API_KEY:
+    if not hmac.compare_digest(api_key.encode(), API_KEY_BYTES):
         logger.warning(
             "Invalid API key provided: %s*** (len %d)",
             api_key[:3],
@@ -68,15 +115,23 @@ async def verify_api_key(api_key: str = Depends(api_key_header)):
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API key",
         )
-    logger.debug("API key validated successfully.")
 
-# Global embedder instance
-embedder = None
+# Global index: one shard per catalog, sharing the CLIP model
+index = None
+
+# Popular query counts, and their results precomputed by the refresh job
+query_log = QueryLog()
+precomputed = PrecomputedResults()
+query_log_task = None
 
 
 class SearchRequest(BaseModel):
     query: str
     top_k: int = 5
+    collapse_duplicates: bool = True
+    mode: Literal["vector", "hybrid"] = config["search_mode"]
+    catalogs: Optional[List[str]] = None  # Shards to search, all by default
+    partial: bool = False  # Sent while the user types; not counted as a query
 
 class SearchResult(BaseModel):
     id: str
@@ -87,6 +142,7 @@ class SearchResult(BaseModel):
     url: str
     image_url: str
     similarity: float
+    catalog: Optional[str] = None
 
 class SearchResponse(BaseModel):
     results: List[SearchResult]
@@ -95,42 +151,74 @@ class SearchResponse(BaseModel):
 
 @app.on_event("startup")
 async def startup_event():
-    global embedder
+    global index
     try:
-        embedder = ImageEmbedder(
+        index = ShardedIndex(
             model_path=config["model_path"],
             chroma_path=config["chroma_db_path"],
         )
         logger.info("Initializing model and database...")
-        embedder.initialize_model()
-        embedder.initialize_database()
+        index.initialize()
         logger.info(
-            "System ready. DB has %d items.",
-            embedder.collection.count(),
+            "System ready. DB has %d items in %d shards.",
+            index.count(),
+            len(index.shards),
         )
     except Exception as e:
-        logger.error(f"Startup failed: {e}")
+        logger.error("Startup failed: %s", e)
         raise
 
+    global query_log_task
+    precomputed.reload_if_changed()
+    query_log_task = asyncio.create_task(flush_query_log_periodically())
+
+
+def sync_with_refresh_jobs() -> None:
+    """
+    Persist query counts for the refresh job, and pick up what it wrote.
+    Blocking; each step is attempted even if an earlier one fails.
+    """
+    steps = [query_log.flush, precomputed.reload_if_changed]
+    if index is not None:
+        steps.append(index.reload_side_indexes)
+    for step in steps:
+        try:
+            step()
+        except Exception:
+            logger.exception("Periodic %s failed", step.__qualname__)
+
+
+async def flush_query_log_periodically():
+    """Run sync_with_refresh_jobs off the event loop, until shutdown"""
+    while True:
+        await asyncio.sleep(config["query_log_flush_seconds"])
+        try:
+            await asyncio.to_thread(sync_with_refresh_jobs)
+        except Exception:
+            logger.exception("Periodic sync with refresh jobs failed")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    query_log.flush()
+    if index is not None:
+        index.close()
+
 
 @app.get("/api/health", dependencies=[Depends(verify_api_key)])
 async def health_check():
     try:
-        if (
-            embedder is None
-            or embedder.model is None
-            or embedder.collection is None
-        ):
+        if index is None or index.model is None or not index.shards:
             return {
                 "status": "unhealthy",
                 "message": "Model or DB not initialized",
             }
 
-        count = embedder.collection.count()
+        count = index.count()
         return {
             "status": "healthy",
-            "model_loaded": embedder.model is not None,
-            "database_connected": embedder.collection is not None,
+            "model_loaded": index.model is not None,
+            "database_connected": bool(index.shards),
             "total_items": count,
             "timestamp": datetime.now().isoformat(),
         }
@@ -138,22 +226,60 @@ async def health_check():
         return {"status": "unhealthy", "error": str(e)}
 
 
+def load_refresh_stats() -> Optional[dict]:
+    """Counts written by the last refresh_database.py run, if any"""
+    try:
+        with open(config["refresh_stats_path"], "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
 @app.get("/api/stats", dependencies=[Depends(verify_api_key)])
 async def get_stats():
     try:
-        if embedder is None or embedder.collection is None:
+        if index is None or not index.shards:
             raise HTTPException(status_code=503, detail="DB not initialized")
 
-        count = embedder.collection.count()
+        counts = index.counts()
         return {
-            "total_items": count,
-            "collection_name": "vinted_dresses_db",
+            "total_items": sum(counts.values()),
+            "shards": counts,
+            "last_refresh": load_refresh_stats(),
             "timestamp": datetime.now().isoformat(),
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def to_search_response(results: List[dict]) -> Response:
+    """
+    Serialize result dicts straight to JSON. They are built with the fields
+    and types of SearchResult (see ImageEmbedder._format_results), so they
+    are not validated again; response_model only documents the schema.
+    """
+    with timed(SEARCH_STAGE_SECONDS, "serialize"):
+        body = orjson.dumps({"results": results, "total_found": len(results)})
+    return Response(content=body, media_type="application/json")
+
+
+def check_catalogs(catalogs: Optional[List[str]]) -> None:
+    """Reject catalogs that have no shard in this API"""
+    unknown = [c for c in catalogs or [] if c not in index.shards]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown catalogs {unknown}, available: {list(index.shards)}",
+        )
+
+
+@app.get("/metrics", dependencies=[Depends(verify_api_key)])
+async def metrics():
+    """Stage latency histograms in Prometheus text format"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 @app.post(
     "/api/search",
     response_model=SearchResponse,
@@ -161,15 +287,12 @@ async def get_stats():
 )
 async def search_items(request: SearchRequest):
     try:
-        if (
-            embedder is None
-            or embedder.model is None
-            or embedder.collection is None
-        ):
+        if index is None or index.model is None or not index.shards:
             raise HTTPException(
                 status_code=503,
                 detail="Model or DB not initialized",
             )
+        check_catalogs(request.catalogs)
 
         if not request.query.strip():
             raise HTTPException(
@@ -177,33 +300,112 @@ async def search_items(request: SearchRequest):
                 detail="Query cannot be empty",
             )
 
-        logger.info(f"Searching for: {request.query}")
-        results = embedder.search_similar(request.query, top_k=request.top_k)
-
-        search_results = [
-            SearchResult(
-                id=str(r["id"]),
-                title=r.get("title", "Unknown"),
-                price=r.get("price"),
-                currency=r.get("currency", "EUR"),
-                url=r.get("url", ""),
-                image_url=r.get("image_url", ""),
-                similarity=r.get("similarity", 0.0),
+        log_request = sample_request()
+        if log_request:
+            logger.info("Searching for: %s", request.query)
+        if not request.partial:
+            query_log.record(request.query)
+
+        # Precomputed results cover searches over all shards only
+        results = None
+        if not request.catalogs:
+            with timed(SEARCH_STAGE_SECONDS, "precomputed_lookup"):
+                results = precomputed.get(
+                    request.query,
+                    request.top_k,
+                    request.collapse_duplicates,
+                    request.mode,
+                )
+        if results is None:
+            results = index.search_similar(
+                request.query,
+                top_k=request.top_k,
+                collapse_duplicates=request.collapse_duplicates,
+                mode=request.mode,
+                catalogs=request.catalogs,
             )
-            for r in results
-        ]
 
-        logger.info(f"Found {len(search_results)} results")
-        return SearchResponse(
-            results=search_results,
-            total_found=len(search_results),
+        if log_request:
+            logger.info("Found %d results", len(results))
+        return to_search_response(results)
+
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Search error: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get(
+    "/api/similar/{item_id}",
+    response_model=SearchResponse,
+    dependencies=[Depends(verify_api_key)],
+)
+async def similar_items(
+    item_id: str,
+    top_k: int = 5,
+    collapse_duplicates: bool = True,
+    catalogs: Optional[List[str]] = Query(None),
+):
+    """More like this: neighbours of an indexed item, without model inference"""
+    if index is None or not index.shards:
+        raise HTTPException(status_code=503, detail="DB not initialized")
+    check_catalogs(catalogs)
+
+    try:
+        results = index.search_by_item(
+            item_id,
+            top_k=top_k,
+            collapse_duplicates=collapse_duplicates,
+            catalogs=catalogs,
         )
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Item {item_id} not found")
+    except Exception as e:
+        logger.error("Similar items error: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return to_search_response(results)
 
 
+@app.post(
+    "/api/search/image",
+    response_model=SearchResponse,
+    dependencies=[Depends(verify_api_key)],
+)
+async def search_by_image(
+    file: UploadFile = File(...),
+    top_k: int = Form(5),
+    collapse_duplicates: bool = Form(True),
+    catalogs: Optional[List[str]] = Form(None),
+):
+    """Search with an uploaded image, embedded with the CLIP vision tower"""
+    if index is None or index.model is None or not index.shards:
+        raise HTTPException(
+            status_code=503,
+            detail="Model or DB not initialized",
+        )
+    check_catalogs(catalogs)
+
+    try:
+        image = ImageEmbedder.load_image(await file.read())
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+
+    try:
+        results = index.search_by_image(
+            image,
+            top_k=top_k,
+            collapse_duplicates=collapse_duplicates,
+            catalogs=catalogs,
+        )
     except Exception as e:
-        logger.error(f"Search error: {e}")
+        logger.error("Image search error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+    return to_search_response(results)
+
 
 if __name__ == "__main__":
     import uvicorn
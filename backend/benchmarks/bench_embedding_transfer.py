@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for handing embeddings from torch to ChromaDB.
+
+Compares the previous path (tensor.tolist() into nested Python floats, which
+ChromaDB converts back to arrays) with contiguous, normalized NumPy arrays:
+- ingest: one write chunk of image embeddings, converted and upserted;
+- query: one text embedding, converted and searched.
+Reports wall time and the peak memory allocated (tracemalloc) per call, for
+the conversion alone and including the ChromaDB call.
+
+Usage: python benchmarks/bench_embedding_transfer.py --chunk 512 --dim 512
+"""
+
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Tuple
+
+import torch
+import chromadb
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from vectors import l2_normalize  # noqa: E402
+
+
+def measure(fn: Callable[[], object], repeats: int) -> Tuple[float, float]:
+    """Mean seconds per call, and peak MiB allocated by one call"""
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    seconds = (time.perf_counter() - start) / repeats
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding transfer benchmark")
+    parser.add_argument("--chunk", type=int, default=512, help="Vectors per write")
+    parser.add_argument("--dim", type=int, default=512, help="Embedding dimension")
+    parser.add_argument("--corpus", type=int, default=20000, help="Indexed vectors")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    client = chromadb.PersistentClient(path=tempfile.mkdtemp(prefix="bench-xfer-"))
+    collection = client.create_collection(
+        "bench_transfer", metadata={"hnsw:space": "cosine"}
+    )
+    step = client.get_max_batch_size()
+    corpus = l2_normalize(torch.randn(args.corpus, args.dim).numpy())
+    for start in range(0, args.corpus, step):
+        collection.add(
+            ids=[str(i) for i in range(start, min(start + step, args.corpus))],
+            embeddings=corpus[start : start + step],
+        )
+
+    outputs = torch.randn(args.chunk, args.dim)  # image features of one chunk
+    text_features = torch.randn(1, args.dim)  # text features of one query
+    written = [0]
+
+    def new_chunk_ids():
+        """Fresh IDs for every write, as ingest only upserts new items"""
+        written[0] += 1
+        return [f"chunk{written[0]}-{i}" for i in range(args.chunk)]
+
+    def legacy_ingest_convert():
+        return outputs.cpu().tolist()
+
+    def array_ingest_convert():
+        return l2_normalize(outputs.cpu().numpy())
+
+    def legacy_query_convert():
+        return [text_features[0].cpu().tolist()]
+
+    def array_query_convert():
+        return l2_normalize(text_features.cpu().numpy())
+
+    cases = [
+        ("ingest convert, lists", legacy_ingest_convert),
+        ("ingest convert, arrays", array_ingest_convert),
+        (
+            "ingest upsert, lists",
+            lambda: collection.upsert(
+                ids=new_chunk_ids(), embeddings=legacy_ingest_convert()
+            ),
+        ),
+        (
+            "ingest upsert, arrays",
+            lambda: collection.upsert(
+                ids=new_chunk_ids(), embeddings=array_ingest_convert()
+            ),
+        ),
+        ("query convert, lists", legacy_query_convert),
+        ("query convert, arrays", array_query_convert),
+        (
+            "query search, lists",
+            lambda: collection.query(
+                query_embeddings=legacy_query_convert(), n_results=20
+            ),
+        ),
+        (
+            "query search, arrays",
+            lambda: collection.query(
+                query_embeddings=array_query_convert(), n_results=20
+            ),
+        ),
+    ]
+
+    print(
+        f"chunk of {args.chunk} x {args.dim} vectors, "
+        f"{args.corpus} indexed, {args.repeats} repeats"
+    )
+    for label, fn in cases:
+        seconds, peak_mib = measure(fn, args.repeats)
+        print(f"  {label:<24} {seconds * 1000:9.3f} ms  {peak_mib:9.3f} MiB peak")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for per-request logging overhead.
+
+Replays the log calls of one /api/search request from many threads:
+- legacy: basicConfig-style synchronous handler, f-string messages and the
+  debug call previously made by verify_api_key;
+- queue: logging_config.setup_logging (queue handler, formatting deferred to
+  the listener), with and without request sampling.
+
+Each setup writes once to a local file and once to a slow stream that stalls
+on every flush, like a container's stdout when its reader falls behind.
+Caller-side time is what request threads spend logging; the queue setups
+also report how long the listener then takes to drain what was queued.
+
+Usage: python benchmarks/bench_logging.py --requests 200000 --threads 8
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from logging_config import sample_request, setup_logging, stop_logging  # noqa: E402
+
+QUERY = "robe longue fleurie Sézane"
+
+
+class SlowStream:
+    """File wrapper whose flush blocks for `delay` seconds"""
+
+    def __init__(self, sink, delay: float):
+        self.sink = sink
+        self.delay = delay
+
+    def write(self, text: str) -> int:
+        return self.sink.write(text)
+
+    def flush(self) -> None:
+        time.sleep(self.delay)
+        self.sink.flush()
+
+
+def legacy_request(logger: logging.Logger, i: int) -> None:
+    """Log calls previously made by one search request"""
+    logger.debug("API key validated successfully.")
+    logger.info(f"Searching for: {QUERY} #{i}")
+    logger.info(f"Found {5} results")
+
+
+def queued_request(logger: logging.Logger, i: int) -> None:
+    """Log calls made by one search request with the shared setup"""
+    log_request = sample_request()
+    if log_request:
+        logger.info("Searching for: %s #%d", QUERY, i)
+    if log_request:
+        logger.info("Found %d results", 5)
+
+
+def run(request_fn, logger, n_requests: int, threads: int) -> float:
+    """Return the wall time to replay `n_requests` from `threads` threads"""
+    per_thread = n_requests // threads
+
+    def worker(offset: int) -> None:
+        for i in range(offset, offset + per_thread):
+            request_fn(logger, i)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(worker, range(0, per_thread * threads, per_thread)))
+    return time.perf_counter() - start
+
+
+def bench_sink(sink, args, n_requests: int) -> list:
+    """Return (label, caller seconds, drain seconds) for each setup on `sink`"""
+    fmt = "[%(levelname)s] %(message)s"
+    results = []
+
+    # Legacy: synchronous handler on the root logger, like basicConfig
+    stop_logging()
+    root = logging.getLogger()
+    root.handlers = [logging.StreamHandler(sink)]
+    root.handlers[0].setFormatter(logging.Formatter(fmt))
+    root.setLevel(logging.INFO)
+    logger = logging.getLogger("app")
+    seconds = run(legacy_request, logger, n_requests, args.threads)
+    results.append(("legacy (sync, f-strings)", seconds, 0.0))
+
+    cases = [
+        ("queue, lazy", 1.0),
+        (f"queue, lazy, sampled {args.sample_rate:g}", args.sample_rate),
+    ]
+    for label, rate in cases:
+        setup_logging(fmt=fmt, sample_rate=rate, stream=sink)
+        logger = logging.getLogger("app")
+        seconds = run(queued_request, logger, n_requests, args.threads)
+        start = time.perf_counter()
+        stop_logging()
+        results.append((label, seconds, time.perf_counter() - start))
+    return results
+
+
+def report(title: str, n_requests: int, results: list) -> None:
+    print(title)
+    for label, seconds, drain in results:
+        print(
+            f"  {label:<34} {seconds * 1000:9.1f} ms  "
+            f"{seconds / n_requests * 1e6:8.2f} us/request  "
+            f"{n_requests / seconds:10.0f} req/s  "
+            f"drain {drain * 1000:8.1f} ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Logging overhead benchmark")
+    parser.add_argument("--requests", type=int, default=200_000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--sample_rate", type=float, default=0.01)
+    parser.add_argument(
+        "--slow_requests",
+        type=int,
+        default=5_000,
+        help="Requests replayed against the slow stream",
+    )
+    parser.add_argument(
+        "--flush_delay_ms",
+        type=float,
+        default=0.2,
+        help="Time the slow stream blocks on each flush",
+    )
+    args = parser.parse_args()
+
+    log_dir = tempfile.mkdtemp(prefix="bench-logging-")
+    with open(os.path.join(log_dir, "file.log"), "w") as sink:
+        file_results = bench_sink(sink, args, args.requests)
+    with open(os.path.join(log_dir, "slow.log"), "w") as sink:
+        slow = SlowStream(sink, args.flush_delay_ms / 1000)
+        slow_results = bench_sink(slow, args, args.slow_requests)
+
+    print(f"Caller-side time, {args.threads} threads")
+    report(f"local file, {args.requests} requests", args.requests, file_results)
+    report(
+        f"slow stream ({args.flush_delay_ms:g} ms per flush), "
+        f"{args.slow_requests} requests",
+        args.slow_requests,
+        slow_results,
+    )
+
+
+if __name__ == "__main__":
+    main()
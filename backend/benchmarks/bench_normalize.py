@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for item normalization and metadata preparation.
+
+Compares the previous per-item implementations (dict per raw item, iterrows
+per DataFrame row) with the columnar ones on synthetic Vinted items.
+
+Usage: python benchmarks/bench_normalize.py --items 100000
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import pandas as pd
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from scraper import VintedScraper  # noqa: E402
+from embeddings import ImageEmbedder  # noqa: E402
+from benchmarks.fixtures import make_synthetic_items  # noqa: E402
+
+
+def legacy_extract_minimal_item_fields(items: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Previous implementation: one dict per item, then DataFrame"""
+    minimal = []
+    for it in items:
+        user = it.get("user") or {}
+        photo = it.get("photo") or {}
+        tip = it.get("total_item_price") or {}
+        box = it.get("item_box") or {}
+        minimal.append(
+            {
+                "ID": it.get("id"),
+                "TITLE": it.get("title"),
+                "PATH": it.get("path"),
+                "USER_ID": user.get("id"),
+                "URL": it.get("url"),
+                "PHOTO_URL": photo.get("url"),
+                "SIZE": it.get("size_title"),
+                "TOTAL_ITEM_PRICE_AMOUNT": tip.get("amount"),
+                "TOTAL_ITEM_PRICE_CURRENCY": tip.get("currency_code"),
+                "STATUS": it.get("status"),
+                "BRAND": box.get("first_line"),
+                "DESCRIPTION": box.get("accessibility_label"),
+            }
+        )
+    return pd.DataFrame(minimal)
+
+
+def legacy_build_metadata(items_df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Previous implementation: iterrows and a dict per row"""
+    metadatas = []
+    for _, row in items_df.iterrows():
+        image_url = row.get("PHOTO_URL")
+        item_id = str(row.get("ID"))
+        if not image_url or pd.isna(image_url) or not item_id or item_id == "nan":
+            continue
+        metadatas.append(
+            {
+                "title": row.get("TITLE", ""),
+                "price": row.get("TOTAL_ITEM_PRICE_AMOUNT"),
+                "currency": row.get("TOTAL_ITEM_PRICE_CURRENCY", "EUR"),
+                "url": row.get("URL", ""),
+                "image_url": image_url,
+                "size": row.get("SIZE", ""),
+                "brand": row.get("BRAND", ""),
+            }
+        )
+    return metadatas
+
+
+def columnar_build_metadata(items_df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Current implementation used by process_batch_embeddings"""
+    items_df = items_df[ImageEmbedder.valid_items_mask(items_df)]
+    return ImageEmbedder.build_metadata_records(items_df)
+
+
+def best_of(fn: Callable, arg: Any, repeat: int) -> float:
+    """Return the best wall time in seconds over `repeat` runs"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Normalization micro-benchmark")
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    items = make_synthetic_items(args.items)
+    items_df = VintedScraper.extract_minimal_item_fields(items)
+
+    # Both paths must produce the same data before timing them
+    legacy_df = legacy_extract_minimal_item_fields(items)
+    assert legacy_df.equals(items_df[legacy_df.columns])
+    legacy_metadatas = legacy_build_metadata(items_df)
+    assert legacy_metadatas == [
+        {key: metadata[key] for key in legacy_metadatas[0]}
+        for metadata in columnar_build_metadata(items_df)
+    ]
+
+    cases = [
+        ("extract (per-item dict)", legacy_extract_minimal_item_fields, items),
+        ("extract (columnar)", VintedScraper.extract_minimal_item_fields, items),
+        ("metadata (iterrows)", legacy_build_metadata, items_df),
+        ("metadata (columnar)", columnar_build_metadata, items_df),
+    ]
+
+    print(f"{args.items} synthetic items, best of {args.repeat}")
+    for name, fn, arg in cases:
+        seconds = best_of(fn, arg, args.repeat)
+        per_item_us = seconds / args.items * 1e6
+        print(f"  {name:<26} {seconds * 1000:9.1f} ms  {per_item_us:6.2f} us/item")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for turning search results into the API response.
+
+Compares the previous path (a SearchResult model per result dict and a
+SearchResponse, validated again by FastAPI's response_model and encoded
+with json) with the current one (result dicts serialized by orjson), for
+several top_k. Both are timed through a FastAPI app, in-process, and the
+ChromaDB-shaped -> result dicts step they share is reported separately.
+The two responses are checked to decode to the same JSON.
+
+Usage: python benchmarks/bench_serialization.py --top_k 5,50,500
+"""
+
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app import SearchResponse, SearchResult, to_search_response  # noqa: E402
+from embeddings import ImageEmbedder  # noqa: E402
+from scraper import VintedScraper  # noqa: E402
+from benchmarks.fixtures import make_synthetic_items  # noqa: E402
+
+
+def legacy_to_search_response(results: List[dict]) -> SearchResponse:
+    """Previous implementation: one Pydantic model per result"""
+    search_results = [
+        SearchResult(
+            id=str(r["id"]),
+            title=r.get("title", "Unknown"),
+            price=r.get("price"),
+            currency=r.get("currency", "EUR"),
+            url=r.get("url", ""),
+            image_url=r.get("image_url", ""),
+            similarity=r.get("similarity", 0.0),
+            catalog=r.get("catalog"),
+        )
+        for r in results
+    ]
+    return SearchResponse(
+        results=search_results,
+        total_found=len(search_results),
+    )
+
+
+def chroma_result(n: int, seed: int = 0) -> Dict[str, Any]:
+    """A single-query ChromaDB result over `n` synthetic items"""
+    rng = random.Random(seed)
+    items_df = VintedScraper.extract_minimal_item_fields(make_synthetic_items(n))
+    metadatas = ImageEmbedder.build_metadata_records(items_df)
+    distances = sorted(rng.uniform(0.2, 0.9) for _ in range(n))
+    return {
+        "ids": [items_df["ID"].astype(str).tolist()],
+        "distances": [distances],
+        "metadatas": [metadatas],
+    }
+
+
+def measure(fn: Callable[[], object], repeats: int) -> float:
+    """Mean milliseconds per call"""
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response serialization benchmark")
+    parser.add_argument("--top_k", default="5,50,500", help="Comma-separated top_k")
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    results: List[dict] = []
+    bench_app = FastAPI()
+
+    @bench_app.get("/legacy", response_model=SearchResponse)
+    async def legacy():
+        return legacy_to_search_response(results)
+
+    @bench_app.get("/fast", response_model=SearchResponse)
+    async def fast():
+        return to_search_response(results)
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # One line per request
+    client = TestClient(bench_app)
+    print(f"{args.repeats} repeats, milliseconds per response")
+    for top_k in [int(k) for k in args.top_k.split(",") if k.strip()]:
+        chroma = chroma_result(top_k)
+        results[:] = ImageEmbedder._format_results(chroma, top_k, False)
+        legacy_body = client.get("/legacy").json()
+        fast_body = client.get("/fast").json()
+        if legacy_body != fast_body:
+            raise AssertionError(f"Responses differ at top_k={top_k}")
+
+        format_ms = measure(
+            lambda: ImageEmbedder._format_results(chroma, top_k, False),
+            args.repeats,
+        )
+        legacy_ms = measure(lambda: client.get("/legacy"), args.repeats)
+        fast_ms = measure(lambda: client.get("/fast"), args.repeats)
+        size_kb = len(json.dumps(fast_body)) / 1024
+        print(
+            f"  top_k={top_k:<4} ({size_kb:7.1f} KiB)  format {format_ms:7.3f}  "
+            f"pydantic {legacy_ms:7.3f}  orjson {fast_ms:7.3f}  "
+            f"({legacy_ms / fast_ms:4.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
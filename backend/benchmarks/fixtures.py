@@ -0,0 +1,157 @@
+"""
+Offline stand-ins used by the benchmarks: synthetic Vinted items, a tiny
+randomly-initialized CLIP checkpoint and a local HTTP server for images.
+"""
+
+import os
+import json
+import random
+import threading
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+
+SYNTHETIC_BRANDS = ["Zara", "Sézane", "H&M", "Mango", "Maje", "Sandro", "Kiabi"]
+SYNTHETIC_COLORS = ["rouge", "noire", "bleue", "blanche", "verte", "fleurie"]
+SYNTHETIC_KINDS = ["Robe", "Robe longue", "Robe midi", "Robe d'été", "Robe pull"]
+
+
+def make_synthetic_items(
+    n: int, image_base_url: str = "https://images.vinted.net", seed: int = 0
+) -> List[Dict[str, Any]]:
+    """Build raw items shaped like the Vinted catalog API response"""
+    rng = random.Random(seed)
+    items = []
+    for i in range(n):
+        brand = rng.choice(SYNTHETIC_BRANDS)
+        title = f"{rng.choice(SYNTHETIC_KINDS)} {rng.choice(SYNTHETIC_COLORS)} {brand}"
+        items.append(
+            {
+                "id": i,
+                "title": title,
+                "path": f"/items/{i}-robe",
+                "user": {"id": i % 977, "login": f"user{i % 977}"},
+                "url": f"https://www.vinted.fr/items/{i}-robe",
+                "photo": {"id": i, "url": f"{image_base_url}/{i}.jpg"},
+                "size_title": rng.choice(["XS", "S", "M", "L"]),
+                "total_item_price": {
+                    "amount": f"{rng.uniform(5, 80):.2f}",
+                    "currency_code": "EUR",
+                },
+                "status": "Très bon état",
+                "item_box": {
+                    "first_line": brand,
+                    "second_line": "M · Très bon état",
+                    "accessibility_label": f"{title}, {brand}, M",
+                },
+            }
+        )
+    return items
+
+
+def write_synthetic_csv(path: str, n: int, image_base_url: str) -> str:
+    """Write `n` synthetic items as a scraped-data CSV and return its path"""
+    from scraper import VintedScraper
+
+    items_df = VintedScraper.extract_minimal_item_fields(
+        make_synthetic_items(n, image_base_url)
+    )
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    items_df.to_csv(path, index=False)
+    return path
+
+
+def make_tiny_clip(path: str, seed: int = 0) -> str:
+    """
+    Save a randomly-initialized, few-layer CLIP checkpoint with a
+    character-level tokenizer, loadable by ImageEmbedder.initialize_model.
+    """
+    import torch
+    from transformers import (
+        CLIPConfig,
+        CLIPImageProcessor,
+        CLIPModel,
+        CLIPProcessor,
+        CLIPTokenizer,
+    )
+
+    if os.path.exists(os.path.join(path, "config.json")):
+        return path
+    os.makedirs(path, exist_ok=True)
+
+    symbols = [chr(c) for c in range(33, 127)]
+    vocab = {s: i for i, s in enumerate(symbols)}
+    vocab.update({f"{s}</w>": len(symbols) + i for i, s in enumerate(symbols)})
+    vocab["<|startoftext|>"] = len(vocab)
+    vocab["<|endoftext|>"] = len(vocab)
+    with open(os.path.join(path, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f)
+    with open(os.path.join(path, "merges.txt"), "w", encoding="utf-8") as f:
+        f.write("#version: 0.2\n")
+
+    tokenizer = CLIPTokenizer(
+        os.path.join(path, "vocab.json"), os.path.join(path, "merges.txt")
+    )
+    image_processor = CLIPImageProcessor(
+        size={"shortest_edge": 32}, crop_size={"height": 32, "width": 32}
+    )
+    CLIPProcessor(image_processor=image_processor, tokenizer=tokenizer).save_pretrained(
+        path
+    )
+
+    torch.manual_seed(seed)
+    tower = dict(
+        hidden_size=32, intermediate_size=64, num_hidden_layers=2, num_attention_heads=2
+    )
+    clip_config = CLIPConfig(
+        text_config=dict(vocab_size=len(vocab), max_position_embeddings=77, **tower),
+        vision_config=dict(image_size=32, patch_size=8, **tower),
+        projection_dim=16,
+    )
+    CLIPModel(clip_config).save_pretrained(path)
+    return path
+
+
+def make_image_pool(size: int, seed: int = 0) -> List[bytes]:
+    """Encode `size` distinct random JPEGs"""
+    import numpy
+    from PIL import Image
+
+    rng = numpy.random.default_rng(seed)
+    pool = []
+    for _ in range(size):
+        pixels = rng.integers(0, 255, (64, 64, 3), dtype=numpy.uint8)
+        buffer = BytesIO()
+        Image.fromarray(pixels).save(buffer, format="JPEG")
+        pool.append(buffer.getvalue())
+    return pool
+
+
+def start_image_server(pool: List[bytes]) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Serve `/<n>.jpg` from the pool (image n % len(pool)) on a free local
+    port, in a daemon thread. Returns the server and its base URL.
+    """
+
+    class ImageHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            try:
+                index = int(self.path.strip("/").split(".")[0])
+            except ValueError:
+                self.send_error(404)
+                return
+            body = pool[index % len(pool)]
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}"
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Offline load generator for ingestion.
+
+Replays a crawl recorded with `--record_path` (scraper.py or
+refresh_database.py) through scrape -> embed -> index, without querying
+Vinted:
+- recorded pages are handed out at `--rate` pages per second, `--scale`
+  times over; every copy gets item IDs of its own, so the index keeps
+  growing and an existing `--chroma_path` is never overwritten;
+- photos are served by a local HTTP server: every (photo URL, copy) maps to
+  one of `--image_pool` synthetic JPEGs, so items sharing a photo in the
+  crawl still share one in the replay;
+- each page goes through the refresh job's ingest path (conversion, then
+  ImageEmbedder.embedd_data) into the catalog's collection, and a lexical
+  index in the run directory is synced every `--index_every` pages and at
+  the end.
+
+Reports ingest items/sec, whether ingestion kept up with the offered rate
+(lag behind the page schedule), and the collection size and on-disk
+database size after every page. Results are saved as JSON.
+
+Usage: python benchmarks/replay_load.py --replay_dir <crawl dir> --rate 2 --scale 10
+       python benchmarks/replay_load.py --synthetic 960 --tiny_model
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import argparse
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from config import get_config  # noqa: E402
+from scraper import VintedScraper  # noqa: E402
+from embeddings import ImageEmbedder, shard_collection_name  # noqa: E402
+from lexical_index import LexicalIndex  # noqa: E402
+from benchmarks.fixtures import (  # noqa: E402
+    make_image_pool,
+    make_synthetic_items,
+    make_tiny_clip,
+    start_image_server,
+)
+
+config = get_config()
+
+
+def record_synthetic_crawl(record_dir: str, n: int, per_page: int) -> str:
+    """Record `n` synthetic items as a crawl of `per_page` item pages"""
+    scraper = VintedScraper(per_page=per_page, record_path=None)
+    scraper.record_dir = record_dir
+    items = make_synthetic_items(n)
+    for page, start in enumerate(range(0, n, per_page), start=1):
+        scraper.record_page(
+            page,
+            {"page": page, "per_page": per_page},
+            {"items": items[start : start + per_page]},
+        )
+    return record_dir
+
+
+def replayed_pages(
+    pages: List[Dict[str, Any]], scale: int, image_base_url: str, run_id: str
+) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+    """
+    Raw items of each recorded page, `scale` times over. Copy k of an item
+    gets ID `replay<run_id>-<k>-<id>`, which no scraped item has, and a
+    local photo standing in for its own.
+    """
+    for copy in range(scale):
+        for page in pages:
+            items = []
+            for item in page["response"].get("items", []):
+                photo = item.get("photo") or {}
+                image_key = zlib.crc32(f"{photo.get('url')}|{copy}".encode())
+                items.append(
+                    dict(
+                        item,
+                        id=f"replay{run_id}-{copy}-{item['id']}",
+                        photo=dict(photo, url=f"{image_base_url}/{image_key}.jpg"),
+                    )
+                )
+            yield copy, items
+
+
+def directory_mb(path: str) -> float:
+    """Total size of the files under `path`"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # Removed by ChromaDB meanwhile
+    return round(total / 2**20, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded crawl")
+    parser.add_argument("--replay_dir", default=None, help="Recorded crawl directory")
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        default=0,
+        help="Record and replay this many synthetic items instead",
+    )
+    parser.add_argument(
+        "--rate", type=float, default=0, help="Pages per second (0: unthrottled)"
+    )
+    parser.add_argument(
+        "--scale", type=int, default=1, help="Times the crawl is replayed"
+    )
+    parser.add_argument("--catalog", default=config["default_catalog"])
+    parser.add_argument("--batch_size", type=int, default=config["batch_size"])
+    parser.add_argument("--image_pool", type=int, default=1024)
+    parser.add_argument(
+        "--index_every",
+        type=int,
+        default=0,
+        help="Sync the lexical index every this many pages (0: only at the end)",
+    )
+    parser.add_argument("--model_path", default=config["model_path"])
+    parser.add_argument(
+        "--tiny_model",
+        action="store_true",
+        default=False,
+        help="Use a tiny random CLIP checkpoint instead of --model_path",
+    )
+    parser.add_argument(
+        "--dedup_threshold", type=float, default=config["dedup_threshold"]
+    )
+    parser.add_argument(
+        "--chroma_path",
+        default=None,
+        help="Database to grow (default: a fresh one in the work directory)",
+    )
+    parser.add_argument(
+        "--workdir",
+        default=str(backend_dir / "benchmarks" / "work"),
+        help="Where the checkpoint, recordings and databases are written",
+    )
+    parser.add_argument("--output", default=None, help="Result JSON path")
+    args = parser.parse_args()
+
+    run_id = str(int(time.time()))
+    run_dir = os.path.join(args.workdir, f"replay-{run_id}")
+    if args.synthetic:
+        args.replay_dir = record_synthetic_crawl(
+            os.path.join(run_dir, "crawl"), args.synthetic, config["items_per_page"]
+        )
+    if not args.replay_dir:
+        parser.error("--replay_dir or --synthetic is required")
+    pages = VintedScraper.load_recorded_pages(args.replay_dir)
+    if not pages:
+        parser.error(f"No recorded pages in {args.replay_dir}")
+
+    model_path = args.model_path
+    if args.tiny_model:
+        model_path = make_tiny_clip(os.path.join(args.workdir, "tiny_clip"))
+    # The lexical index is always the run's own, even for an existing database
+    chroma_path = args.chroma_path or os.path.join(run_dir, "chroma")
+    lexical_path = os.path.join(run_dir, "lexical_index")
+    server, image_base_url = start_image_server(make_image_pool(args.image_pool))
+
+    embedder = ImageEmbedder(
+        model_path=model_path,
+        chroma_path=chroma_path,
+        checkpoint_path=os.path.join(run_dir, "ingest_checkpoint.txt"),
+        dedup_threshold=args.dedup_threshold,
+        collection_name=shard_collection_name(args.catalog),
+    )
+    embedder.initialize_model()
+    embedder.initialize_database()
+    lexical_index = LexicalIndex(path=embedder.shard_path(lexical_path))
+    lexical_index.load()
+    initial_count = embedder.collection.count()
+
+    def sync_lexical_index() -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        report = lexical_index.sync(
+            embedder.collection, embedder.client.get_max_batch_size()
+        )
+        report["seconds"] = round(time.perf_counter() - t0, 3)
+        return report
+
+    timeline: List[Dict[str, Any]] = []
+    index_syncs: List[Dict[str, Any]] = []
+    offered = added = 0
+    embed_seconds = 0.0
+    start = time.perf_counter()
+    try:
+        for i, (copy, items) in enumerate(
+            replayed_pages(pages, args.scale, image_base_url, run_id)
+        ):
+            # Hold the page back until its slot; lag is how late it starts
+            scheduled = start + i / args.rate if args.rate > 0 else time.perf_counter()
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            lag = time.perf_counter() - scheduled
+
+            t0 = time.perf_counter()
+            items_df = VintedScraper.extract_minimal_item_fields(items)
+            page_added = embedder.embedd_data(items_df, batch_size=args.batch_size)
+            embed_seconds += time.perf_counter() - t0
+            offered += len(items)
+            added += page_added
+
+            if args.index_every and (i + 1) % args.index_every == 0:
+                index_syncs.append(sync_lexical_index())
+            timeline.append(
+                {
+                    "page": i + 1,
+                    "copy": copy,
+                    "offered": len(items),
+                    "added": page_added,
+                    "lag_s": round(lag, 3),
+                    "elapsed_s": round(time.perf_counter() - start, 3),
+                    "count": embedder.collection.count(),
+                    "db_mb": directory_mb(chroma_path),
+                }
+            )
+        index_syncs.append(sync_lexical_index())
+    finally:
+        server.shutdown()
+        embedder.clear_checkpoint()
+
+    wall = time.perf_counter() - start
+    summary = {
+        "replay_dir": args.replay_dir,
+        "recorded_pages": len(pages),
+        "scale": args.scale,
+        "rate": args.rate,
+        "pages": len(timeline),
+        "offered": offered,
+        "added": added,
+        "seconds": round(wall, 3),
+        "items_per_sec": round(added / embed_seconds, 2) if embed_seconds else None,
+        "pages_per_sec": round(len(timeline) / wall, 2) if wall else None,
+        "max_lag_s": max((row["lag_s"] for row in timeline), default=0.0),
+        "initial_count": initial_count,
+        "final_count": embedder.collection.count(),
+        "db_mb": directory_mb(chroma_path),
+        "lexical_index": index_syncs[-1],
+        "lexical_sync_seconds": round(sum(s["seconds"] for s in index_syncs), 3),
+    }
+    print(json.dumps(summary, indent=2))
+
+    output = args.output or str(
+        backend_dir
+        / "benchmarks"
+        / "results"
+        / f"replay-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({**summary, "timeline": timeline, "index_syncs": index_syncs}, f)
+    print(f"Saved results to {output}")
+
+
+if __name__ == "__main__":
+    main()
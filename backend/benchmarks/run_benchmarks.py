@@ -0,0 +1,562 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark suite for ingest and search, fully offline.
+
+For each dataset size it:
+- writes a synthetic scraped-data CSV whose photos are served by a local
+  HTTP server, and ingests it with a tiny randomly-initialized CLIP
+  checkpoint into a fresh ChromaDB (items/sec, peak RSS);
+- starts the API with uvicorn on that database (startup time) and fires
+  concurrent /api/search requests (p50/p95/p99 latency, QPS, peak RSS);
+- with --ingest_during_search, repeats the search load while the same CSV
+  is ingested into a scratch database, once per INGEST_PRIORITY, to show
+  how much a running refresh slows live search down.
+
+Results are saved as JSON; pass a previous file with --compare to print the
+relative change of every metric.
+
+Usage: python benchmarks/run_benchmarks.py --sizes 1000,10000,100000
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import threading
+import argparse
+import platform
+import resource
+import subprocess
+import multiprocessing
+from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy
+import requests
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from benchmarks.fixtures import (  # noqa: E402
+    SYNTHETIC_BRANDS,
+    SYNTHETIC_COLORS,
+    SYNTHETIC_KINDS,
+    make_image_pool,
+    make_tiny_clip,
+    start_image_server,
+    write_synthetic_csv,
+)
+
+API_KEY = "bench-key"
+
+# Metrics compared by --compare, with whether higher is better
+COMPARED_METRICS = {
+    "ingest": {"items_per_sec": True, "peak_rss_mb": False},
+    "search": {
+        "startup_s": False,
+        "p50_ms": False,
+        "p95_ms": False,
+        "p99_ms": False,
+        "qps": True,
+        "peak_rss_mb": False,
+    },
+    "search_under_ingest": {
+        "p50_ms": False,
+        "p95_ms": False,
+        "p99_ms": False,
+        "qps": True,
+        "ingest_items_per_sec": True,
+    },
+}
+
+
+def peak_rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """Peak resident memory of this process, or of `pid` on Linux"""
+    if pid is None:
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes on Linux
+        return round(peak_kb / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def free_port() -> int:
+    """Ask the OS for an unused local TCP port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def data_env(workdir: str) -> Dict[str, str]:
+    """
+    Point every file the backend reads or writes at `workdir`, so runs
+    neither use nor pollute the real data/ directory
+    """
+    return {
+        "REFRESH_STATS_PATH": os.path.join(workdir, "refresh_stats.json"),
+        "QUERY_LOG_PATH": os.path.join(workdir, "query_counts.json"),
+        "PRECOMPUTED_RESULTS_PATH": os.path.join(workdir, "precomputed_results.json"),
+        "LEXICAL_INDEX_PATH": os.path.join(workdir, "lexical_index"),
+        "COMPACT_INDEX_PATH": os.path.join(workdir, "compact_index"),
+        "CHECKPOINT_PATH": os.path.join(workdir, "ingest_checkpoint.txt"),
+        "SERVING_REGISTRY_PATH": os.path.join(workdir, "serving"),
+    }
+
+
+def ingest_case(
+    csv_path: str,
+    model_path: str,
+    chroma_path: str,
+    batch_size: int,
+    dedup_threshold: float,
+    env: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    """
+    Ingest one CSV into a fresh database; runs in a child process, with
+    `env` set before the backend reads its configuration
+    """
+    os.environ.update(data_env(os.path.dirname(chroma_path)))
+    os.environ.update(env or {})
+    import pandas as pd
+    from embeddings import ImageEmbedder
+
+    embedder = ImageEmbedder(
+        model_path=model_path,
+        chroma_path=chroma_path,
+        checkpoint_path=os.path.join(chroma_path, "ingest_checkpoint.txt"),
+        dedup_threshold=dedup_threshold,
+    )
+    embedder.initialize_model()
+    embedder.initialize_database()
+    items_df = pd.read_csv(csv_path)
+
+    start = time.perf_counter()
+    added = embedder.process_batch_embeddings(items_df, batch_size=batch_size)
+    seconds = time.perf_counter() - start
+
+    return {
+        "rows": len(items_df),
+        "added": added,
+        "seconds": round(seconds, 3),
+        "items_per_sec": round(added / seconds, 2) if seconds else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_ingest(
+    csv_path: str,
+    model_path: str,
+    chroma_path: str,
+    batch_size: int,
+    dedup_threshold: float,
+) -> Dict[str, Any]:
+    """Run ingest_case in a fresh process so its peak memory is isolated"""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(
+            ingest_case, csv_path, model_path, chroma_path, batch_size, dedup_threshold
+        ).result()
+
+
+def start_background_ingest(
+    csv_path: str,
+    model_path: str,
+    chroma_path: str,
+    batch_size: int,
+    dedup_threshold: float,
+    priority: str,
+):
+    """Start ingest_case at `priority` in a child process; returns its future"""
+    context = multiprocessing.get_context("spawn")
+    pool = ProcessPoolExecutor(max_workers=1, mp_context=context)
+    future = pool.submit(
+        ingest_case,
+        csv_path,
+        model_path,
+        chroma_path,
+        batch_size,
+        dedup_threshold,
+        {"INGEST_PRIORITY": priority},
+    )
+    pool.shutdown(wait=False)
+    return future
+
+
+def synthetic_queries(n: int, seed: int = 0) -> List[str]:
+    """Text queries mixing the vocabulary of the synthetic titles"""
+    rng = random.Random(seed)
+    return [
+        f"{rng.choice(SYNTHETIC_KINDS)} {rng.choice(SYNTHETIC_COLORS)} "
+        f"{rng.choice(SYNTHETIC_BRANDS)}"
+        for _ in range(n)
+    ]
+
+
+def start_api(model_path: str, chroma_path: str, workdir: str, port: int, log):
+    """Start the API with uvicorn on the given database, logging to `log`"""
+    env = dict(
+        os.environ,
+        API_KEY=API_KEY,
+        MODEL_PATH=model_path,
+        CHROMA_DB_PATH=chroma_path,
+        **data_env(workdir),
+    )
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=str(backend_dir),
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+
+def wait_until_ready(base_url: str, proc: subprocess.Popen, timeout: float) -> None:
+    """Poll /api/health until the API reports healthy"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"API exited during startup (code {proc.returncode})")
+        try:
+            r = requests.get(
+                f"{base_url}/api/health", headers={"x-api-key": API_KEY}, timeout=1
+            )
+            if r.ok and r.json().get("status") == "healthy":
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(f"API not ready after {timeout}s")
+
+
+def search_load(
+    base_url: str, n_requests: int, concurrency: int, top_k: int, warmup: int
+) -> Dict[str, float]:
+    """Fire concurrent /api/search requests; latency percentiles and QPS"""
+    queries = synthetic_queries(n_requests + warmup)
+    local = threading.local()
+
+    def search(query: str) -> float:
+        # One keep-alive session per client thread
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        t0 = time.perf_counter()
+        r = local.session.post(
+            f"{base_url}/api/search",
+            json={"query": query, "top_k": top_k},
+            headers={"x-api-key": API_KEY},
+            timeout=30,
+        )
+        r.raise_for_status()
+        return time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(search, queries[:warmup]))
+        wall_start = time.perf_counter()
+        latencies = list(pool.map(search, queries[warmup:]))
+        wall = time.perf_counter() - wall_start
+
+    p50, p95, p99 = numpy.percentile(numpy.array(latencies) * 1000, [50, 95, 99])
+    return {
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "qps": round(n_requests / wall, 2),
+    }
+
+
+def run_search(
+    model_path: str,
+    chroma_path: str,
+    workdir: str,
+    rows: int,
+    n_requests: int,
+    concurrency: int,
+    top_k: int,
+    warmup: int,
+) -> Dict[str, Any]:
+    """Measure API startup time and search latency under concurrent load"""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+
+    log = open(os.path.join(workdir, f"api-{port}.log"), "w", encoding="utf-8")
+    start = time.perf_counter()
+    proc = start_api(model_path, chroma_path, workdir, port, log)
+    try:
+        wait_until_ready(base_url, proc, timeout=120)
+        startup_s = time.perf_counter() - start
+        latency = search_load(base_url, n_requests, concurrency, top_k, warmup)
+        return {
+            "rows": rows,
+            "requests": n_requests,
+            "concurrency": concurrency,
+            "top_k": top_k,
+            "startup_s": round(startup_s, 3),
+            **latency,
+            "peak_rss_mb": peak_rss_mb(proc.pid),
+        }
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        log.close()
+
+
+def run_search_under_ingest(
+    model_path: str,
+    chroma_path: str,
+    workdir: str,
+    rows: int,
+    csv_path: str,
+    priorities: List[str],
+    args: argparse.Namespace,
+) -> List[Dict[str, Any]]:
+    """
+    Search latency while a refresh ingests `csv_path` into a scratch
+    database, once per ingest priority. `ingest_overlapped` is false when
+    the ingest finished before the search load did, in which case part of
+    the load ran without competition.
+    """
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    log = open(os.path.join(workdir, f"api-{port}.log"), "w", encoding="utf-8")
+    proc = start_api(model_path, chroma_path, workdir, port, log)
+    cases = []
+    try:
+        wait_until_ready(base_url, proc, timeout=120)
+        for priority in priorities:
+            ingest = start_background_ingest(
+                csv_path,
+                model_path,
+                os.path.join(workdir, f"chroma-ingest-{priority}"),
+                args.batch_size,
+                args.dedup_threshold,
+                priority,
+            )
+            latency = search_load(
+                base_url, args.requests, args.concurrency, args.top_k, args.warmup
+            )
+            overlapped = not ingest.done()
+            ingest_result = ingest.result()
+            cases.append(
+                {
+                    "rows": rows,
+                    "ingest_priority": priority,
+                    "requests": args.requests,
+                    "concurrency": args.concurrency,
+                    "top_k": args.top_k,
+                    **latency,
+                    "ingest_items_per_sec": ingest_result["items_per_sec"],
+                    "ingest_overlapped": overlapped,
+                }
+            )
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        log.close()
+    return cases
+
+
+def environment_info() -> Dict[str, Any]:
+    """Describe the machine and code version the results come from"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=str(backend_dir),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    import torch
+
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    """Print the relative change of each metric against a previous run"""
+    print(f"\nComparison with {baseline['environment'].get('commit')}:")
+    for section, metrics in COMPARED_METRICS.items():
+        previous = {
+            (row["rows"], row.get("ingest_priority")): row
+            for row in baseline.get(section, [])
+        }
+        for row in current.get(section, []):
+            before = previous.get((row["rows"], row.get("ingest_priority")))
+            if before is None:
+                continue
+            for metric, higher_is_better in metrics.items():
+                old, new = before.get(metric), row.get(metric)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old * 100
+                better = (change > 0) == higher_is_better
+                verdict = "better" if better else "worse"
+                print(
+                    f"  {section:<6} {row['rows']:>7} rows  {metric:<13} "
+                    f"{old:>10} -> {new:<10} {change:+6.1f}% ({verdict})"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest and search benchmarks")
+    parser.add_argument(
+        "--sizes",
+        default="1000,10000,100000",
+        help="Comma-separated synthetic dataset sizes",
+    )
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--top_k", type=int, default=5)
+    parser.add_argument("--batch_size", type=int, default=6)
+    parser.add_argument(
+        "--image_pool",
+        type=int,
+        default=1024,
+        help="Distinct synthetic images; rows beyond reuse them as duplicates",
+    )
+    parser.add_argument(
+        "--dedup_threshold",
+        type=float,
+        default=0.9999,
+        help="The random checkpoint embeds all images close together, so "
+        "only identical images should be grouped",
+    )
+    parser.add_argument(
+        "--workdir",
+        default=str(backend_dir / "benchmarks" / "work"),
+        help="Where the checkpoint, CSVs and databases are written",
+    )
+    parser.add_argument("--output", default=None, help="Result JSON path")
+    parser.add_argument("--compare", default=None, help="Previous result JSON")
+    parser.add_argument("--skip_search", action="store_true", default=False)
+    parser.add_argument(
+        "--ingest_during_search",
+        action="store_true",
+        default=False,
+        help="Also measure search latency while an ingest is running",
+    )
+    parser.add_argument(
+        "--ingest_priorities",
+        default="normal,idle",
+        help="Comma-separated INGEST_PRIORITY values of the concurrent ingest",
+    )
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    os.makedirs(args.workdir, exist_ok=True)
+    model_path = make_tiny_clip(os.path.join(args.workdir, "tiny_clip"))
+    server, image_base_url = start_image_server(make_image_pool(args.image_pool))
+
+    results: Dict[str, Any] = {
+        "environment": environment_info(),
+        "ingest": [],
+        "search": [],
+        "search_under_ingest": [],
+    }
+    try:
+        for rows in sizes:
+            run_dir = os.path.join(args.workdir, f"run-{rows}-{int(time.time())}")
+            csv_path = write_synthetic_csv(
+                os.path.join(run_dir, "scrapped_data.csv"), rows, image_base_url
+            )
+            chroma_path = os.path.join(run_dir, "chroma")
+
+            print(f"[{rows} rows] ingest...", flush=True)
+            ingest = run_ingest(
+                csv_path,
+                model_path,
+                chroma_path,
+                args.batch_size,
+                args.dedup_threshold,
+            )
+            results["ingest"].append(ingest)
+            print(f"  {ingest}", flush=True)
+
+            if args.skip_search:
+                continue
+            print(f"[{rows} rows] search...", flush=True)
+            search = run_search(
+                model_path,
+                chroma_path,
+                run_dir,
+                rows,
+                args.requests,
+                args.concurrency,
+                args.top_k,
+                args.warmup,
+            )
+            results["search"].append(search)
+            print(f"  {search}", flush=True)
+
+            if not args.ingest_during_search:
+                continue
+            print(f"[{rows} rows] search during ingest...", flush=True)
+            for case in run_search_under_ingest(
+                model_path,
+                chroma_path,
+                run_dir,
+                rows,
+                csv_path,
+                [p for p in args.ingest_priorities.split(",") if p],
+                args,
+            ):
+                results["search_under_ingest"].append(case)
+                print(f"  {case}", flush=True)
+    finally:
+        server.shutdown()
+
+    output = args.output or str(
+        backend_dir
+        / "benchmarks"
+        / "results"
+        / f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+"""
+Compact vector index for serving large catalogs.
+
+Embeddings are L2-normalized and reduced with a PCA fitted on the corpus,
+and the reduced vectors get their own ChromaDB collection, so the HNSW
+graph and its vectors shrink by the reduction factor. The full vectors are
+kept quantized (float16 or int8) in a memory-mapped file and used to
+re-rank the ANN candidates, so the final top-k is ordered at full precision.
+
+The refresh job builds a new version next to the current one and switches
+a manifest to it; the API picks the new version up when the manifest
+changes. Superseded versions are deleted once no API process serves them
+(see versions.ServingRegistry).
+"""
+
+import os
+import json
+import time
+import shutil
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy
+
+from config import get_config
+from vectors import l2_normalize
+from versions import ServingRegistry, read_manifest, write_manifest
+
+config = get_config()
+
+logger = logging.getLogger(__name__)
+
+QUANTIZED_DTYPES = ("float16", "int8")
+PCA_MAX_SAMPLES = 20000  # Vectors sampled to fit the projection
+
+
+def fit_pca(
+    vectors: numpy.ndarray, dim: int, seed: int = 0
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Mean and top `dim` principal axes of (a sample of) `vectors`"""
+    if len(vectors) > PCA_MAX_SAMPLES:
+        rng = numpy.random.default_rng(seed)
+        vectors = vectors[rng.choice(len(vectors), PCA_MAX_SAMPLES, replace=False)]
+    mean = vectors.mean(axis=0)
+    _, _, axes = numpy.linalg.svd(vectors - mean, full_matrices=False)
+    return mean.astype(numpy.float32), axes[:dim].astype(numpy.float32)
+
+
+def quantize(
+    vectors: numpy.ndarray, dtype: str
+) -> Tuple[numpy.ndarray, Optional[numpy.ndarray]]:
+    """Codes for unit vectors, plus per-vector scales for int8"""
+    if dtype == "float16":
+        return vectors.astype(numpy.float16), None
+    if dtype == "int8":
+        scales = numpy.abs(vectors).max(axis=1) / 127.0 + 1e-12
+        codes = numpy.rint(vectors / scales[:, None]).astype(numpy.int8)
+        return codes, scales.astype(numpy.float32)
+    raise ValueError(f"dtype must be one of {QUANTIZED_DTYPES}, got {dtype!r}")
+
+
+def dequantize(
+    codes: numpy.ndarray, scales: Optional[numpy.ndarray]
+) -> numpy.ndarray:
+    """Unit float32 vectors back from their codes"""
+    vectors = codes.astype(numpy.float32)
+    if scales is not None:
+        vectors *= scales[:, None]
+    return l2_normalize(vectors)
+
+
+class CompactIndex:
+    """PCA-reduced ChromaDB collection plus quantized full vectors for re-ranking"""
+
+    def __init__(
+        self,
+        path: str = config["compact_index_path"],
+        dim: int = config["compact_dim"],
+        dtype: str = config["compact_dtype"],
+        rerank_factor: int = config["rerank_factor"],
+    ):
+        if dtype not in QUANTIZED_DTYPES:
+            raise ValueError(f"dtype must be one of {QUANTIZED_DTYPES}, got {dtype!r}")
+        self.path = path
+        self.dim = dim
+        self.dtype = dtype
+        self.rerank_factor = rerank_factor
+        self.collection = None
+        self.manifest: Dict[str, Any] = {}
+        self.mean: Optional[numpy.ndarray] = None
+        self.components: Optional[numpy.ndarray] = None
+        self.codes: Optional[numpy.ndarray] = None
+        self.scales: Optional[numpy.ndarray] = None
+        self.row_of: Dict[str, int] = {}
+        self._manifest_mtime: Optional[float] = None
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.path, "manifest.json")
+
+    def reduce(self, vectors: numpy.ndarray) -> numpy.ndarray:
+        """Project full embeddings into the compact space"""
+        return l2_normalize((l2_normalize(vectors) - self.mean) @ self.components.T)
+
+    # --- Build (refresh job) ---
+
+    def build(self, client, source, name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Build a new version from every vector of the `source` collection,
+        switch the manifest to it and return a report with its recall.
+        Its collection is named after `name`, the shard (default: `source`).
+        """
+        name = name or source.name
+        count = source.count()
+        if count == 0:
+            raise ValueError("Cannot build a compact index from an empty collection")
+        step = client.get_max_batch_size()
+
+        # Pass 1: full vectors, normalized
+        ids: List[str] = []
+        vectors = None
+        for offset in range(0, count, step):
+            page = source.get(include=["embeddings"], limit=step, offset=offset)
+            page_vectors = l2_normalize(page["embeddings"])
+            if vectors is None:
+                vectors = numpy.empty((count, page_vectors.shape[1]), numpy.float32)
+            vectors[len(ids) : len(ids) + len(page_vectors)] = page_vectors
+            ids.extend(page["ids"])
+        vectors = vectors[: len(ids)]
+        full_dim = vectors.shape[1]
+        if not 0 < self.dim < full_dim:
+            raise ValueError(
+                f"dim must be between 1 and {full_dim - 1}, got {self.dim}"
+            )
+
+        self.mean, self.components = fit_pca(vectors, self.dim)
+        self.codes, self.scales = quantize(vectors, self.dtype)
+        self.row_of = {item_id: row for row, item_id in enumerate(ids)}
+
+        # Pass 2: reduced vectors, with the source metadata, in a new collection
+        previous = self._read_manifest() or {}
+        version = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        collection_name = f"{name}_compact_{version}"
+        self.collection = client.create_collection(
+            collection_name, metadata={"hnsw:space": "cosine"}
+        )
+        for offset in range(0, count, step):
+            page = source.get(include=["metadatas"], limit=step, offset=offset)
+            rows = [self.row_of[item_id] for item_id in page["ids"]]
+            self.collection.add(
+                ids=page["ids"],
+                embeddings=self.reduce(vectors[rows]),
+                metadatas=page["metadatas"],
+            )
+
+        version_dir = os.path.join(self.path, version)
+        os.makedirs(version_dir, exist_ok=True)
+        numpy.save(os.path.join(version_dir, "codes.npy"), self.codes)
+        if self.scales is not None:
+            numpy.save(os.path.join(version_dir, "scales.npy"), self.scales)
+        numpy.savez(
+            os.path.join(version_dir, "pca.npz"),
+            mean=self.mean,
+            components=self.components,
+        )
+        with open(os.path.join(version_dir, "ids.json"), "w", encoding="utf-8") as f:
+            json.dump(ids, f)
+
+        self.manifest = {
+            "version": version,
+            "collection": collection_name,
+            "source": source.name,
+            "count": len(ids),
+            "full_dim": full_dim,
+            "dim": self.dim,
+            "dtype": self.dtype,
+            "built_at": datetime.now().isoformat(),
+            "superseded": previous.get("superseded", {}),
+        }
+        if previous.get("collection"):
+            self.manifest["superseded"][previous["collection"]] = time.time()
+        self._write_manifest(self.manifest)
+        self.retire_superseded_versions(client, name)
+
+        report = {
+            "count": len(ids),
+            "dim": self.dim,
+            "dtype": self.dtype,
+            "index_bytes_per_vector": {"full": full_dim * 4, "compact": self.dim * 4},
+            "rerank_bytes_per_vector": self.codes.itemsize * full_dim
+            + (4 if self.scales is not None else 0),
+            "recall": self.measure_recall(vectors, ids, source),
+        }
+        logger.info(
+            "Built compact index %s: %d vectors, %d -> %d dims, %s re-rank store",
+            version,
+            len(ids),
+            full_dim,
+            self.dim,
+            self.dtype,
+        )
+        return report
+
+    def measure_recall(
+        self,
+        vectors: numpy.ndarray,
+        ids: List[str],
+        source,
+        k: int = 10,
+        n_queries: int = 200,
+        seed: int = 0,
+    ) -> Dict[str, Any]:
+        """
+        Recall@k of the compact index and of the full-precision `source`
+        collection against exact search, using indexed items as queries
+        (each query's own item is left out of every result list).
+        """
+        k = min(k, len(ids) - 1)
+        if k < 1:
+            return {"k": k, "queries": 0}
+        rng = numpy.random.default_rng(seed)
+        picks = rng.choice(len(ids), min(n_queries, len(ids)), replace=False)
+        recalls: Dict[str, List[float]] = {"compact": [], "baseline": []}
+
+        for start in range(0, len(picks), 32):
+            block = picks[start : start + 32]
+            queries = vectors[block]
+
+            similarities = queries @ vectors.T
+            similarities[numpy.arange(len(block)), block] = -numpy.inf
+            exact = numpy.argpartition(-similarities, k, axis=1)[:, :k]
+
+            compact = self.rerank(queries, self.candidates(queries, k + 1), k + 1)
+            baseline = source.query(
+                query_embeddings=queries, n_results=k + 1, include=["distances"]
+            )
+            for i, row in enumerate(block):
+                truth = {ids[j] for j in exact[i]}
+                for name, results in (("compact", compact), ("baseline", baseline)):
+                    found = [x for x in results["ids"][i] if x != ids[row]][:k]
+                    recalls[name].append(len(truth.intersection(found)) / k)
+
+        report = {"k": k, "queries": len(picks)}
+        for name, values in recalls.items():
+            report[name] = round(float(numpy.mean(values)), 4)
+        logger.info(
+            "Recall@%d vs exact search: compact %.4f, full-precision HNSW %.4f",
+            k,
+            report["compact"],
+            report["baseline"],
+        )
+        return report
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        return read_manifest(self.manifest_path)
+
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        write_manifest(self.manifest_path, manifest)
+        self._manifest_mtime = os.stat(self.manifest_path).st_mtime
+
+    @staticmethod
+    def _version_of(collection_name: str) -> str:
+        return collection_name.rsplit("_compact_", 1)[-1]
+
+    def retire_superseded_versions(
+        self, client, name: str, registry: Optional[ServingRegistry] = None
+    ) -> List[str]:
+        """
+        Delete superseded versions (collection and re-rank files) once no
+        API process serves them. Versions the manifest does not know, left
+        by an interrupted build, are marked superseded first.
+        """
+        manifest = self._read_manifest()
+        if manifest is None:
+            return []
+        superseded = manifest.setdefault("superseded", {})
+        known = {manifest["collection"], *superseded}
+        changed = False
+        orphans = [
+            getattr(collection, "name", collection)
+            for collection in client.list_collections()
+        ]
+        orphans += [
+            f"{name}_compact_{entry}"
+            for entry in os.listdir(self.path)
+            if os.path.isdir(os.path.join(self.path, entry))
+        ]
+        for collection_name in orphans:
+            if collection_name.startswith(f"{name}_compact_"):
+                if collection_name not in known:
+                    superseded[collection_name] = time.time()
+                    known.add(collection_name)
+                    changed = True
+
+        registry = registry or ServingRegistry()
+        retired = registry.retirable(superseded)
+        for collection_name in retired:
+            try:
+                client.delete_collection(collection_name)
+            except Exception:
+                pass  # Only its re-rank files were left
+            version_dir = os.path.join(self.path, self._version_of(collection_name))
+            shutil.rmtree(version_dir, ignore_errors=True)
+            del superseded[collection_name]
+            changed = True
+        if changed:
+            self._write_manifest(manifest)
+            if manifest["version"] == self.manifest.get("version"):
+                self.manifest = manifest
+        if retired:
+            logger.info("Retired compact index versions %s", retired)
+        return retired
+
+    # --- Serve (API) ---
+
+    def load(self, client) -> bool:
+        """Open the version named by the manifest; False if none is built"""
+        manifest = self._read_manifest()
+        if manifest is None:
+            return False
+        version_dir = os.path.join(self.path, manifest["version"])
+        collection = client.get_collection(manifest["collection"])
+        pca = numpy.load(os.path.join(version_dir, "pca.npz"))
+        codes = numpy.load(os.path.join(version_dir, "codes.npy"), mmap_mode="r")
+        scales_path = os.path.join(version_dir, "scales.npy")
+        scales = numpy.load(scales_path) if os.path.exists(scales_path) else None
+        with open(os.path.join(version_dir, "ids.json"), "r", encoding="utf-8") as f:
+            ids = json.load(f)
+
+        self.collection = collection
+        self.mean, self.components = pca["mean"], pca["components"]
+        self.codes, self.scales = codes, scales
+        self.row_of = {item_id: row for row, item_id in enumerate(ids)}
+        self.dim, self.dtype = manifest["dim"], manifest["dtype"]
+        self.manifest = manifest
+        self._manifest_mtime = os.stat(self.manifest_path).st_mtime
+        logger.info(
+            "Loaded compact index %s (%d vectors, %d dims, %s re-rank store)",
+            manifest["version"],
+            len(ids),
+            self.dim,
+            self.dtype,
+        )
+        return True
+
+    def reload_if_changed(self, client) -> None:
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime
+        except OSError:
+            return
+        if mtime == self._manifest_mtime:
+            return
+        manifest = self._read_manifest() or {}
+        if manifest.get("collection") == self.manifest.get("collection"):
+            # Only the list of superseded versions changed
+            self._manifest_mtime = mtime
+            return
+        try:
+            self.load(client)
+        except Exception as e:
+            logger.warning("Could not load compact index: %s", e)
+
+    def get(self, ids: List[str]) -> Dict[str, Any]:
+        """
+        Metadata and unit vectors (from the re-rank store) of indexed items,
+        shaped like a ChromaDB get
+        """
+        stored = self.collection.get(ids=ids, include=["metadatas"])
+        rows = numpy.array([self.row_of[item_id] for item_id in stored["ids"]], int)
+        scales = self.scales[rows] if self.scales is not None else None
+        stored["embeddings"] = dequantize(self.codes[rows], scales)
+        return stored
+
+    def candidates(
+        self, query_vectors: numpy.ndarray, n_results: int
+    ) -> Dict[str, Any]:
+        """ANN candidates for the final `n_results`, from the reduced collection"""
+        n_candidates = min(n_results * self.rerank_factor, len(self.row_of))
+        return self.collection.query(
+            query_embeddings=self.reduce(query_vectors),
+            n_results=n_candidates,
+            include=["metadatas"],
+        )
+
+    def rerank(
+        self,
+        query_vectors: numpy.ndarray,
+        candidates: Dict[str, Any],
+        n_results: int,
+    ) -> Dict[str, Any]:
+        """
+        Order each query's candidates by full-precision cosine similarity.
+        Returns a ChromaDB-shaped result with ids, distances and metadatas.
+        """
+        query_vectors = l2_normalize(query_vectors)
+        results: Dict[str, List[Any]] = {"ids": [], "distances": [], "metadatas": []}
+        for query, hit_ids, hit_metadatas in zip(
+            query_vectors, candidates["ids"], candidates["metadatas"]
+        ):
+            rows = numpy.array([self.row_of[item_id] for item_id in hit_ids], int)
+            scales = self.scales[rows] if self.scales is not None else None
+            similarities = dequantize(self.codes[rows], scales) @ query
+            order = numpy.argsort(-similarities, kind="stable")[:n_results]
+            results["ids"].append([hit_ids[i] for i in order])
+            results["distances"].append((1.0 - similarities[order]).tolist())
+            results["metadatas"].append([hit_metadatas[i] for i in order])
+        return results
@@ -26,9 +26,40 @@ VINTED_BASE_URL = "https://www.vinted.fr"
 VINTED_API_ENDPOINT = "/api/v2/catalog/items"
 VINTED_API_URL = VINTED_BASE_URL + VINTED_API_ENDPOINT
 DEFAULT_CATALOG_ID = 10  # Dresses
+DEFAULT_CATALOG = "dresses"  # Catalog (and index shard) refreshed by default
+SHARD_COLLECTION_TEMPLATE = "vinted_{catalog}_db"  # One collection per catalog
 ITEMS_PER_PAGE = 96
 MAX_PAGES = 5
 BATCH_SIZE = 6  # For embedding processing
+WRITE_CHUNK_SIZE = 512  # Embeddings buffered per ChromaDB upsert
+CHECKPOINT_PATH = DIR_PATH + "/" + "data/checkpoints/ingest_checkpoint.txt"
+DEDUP_THRESHOLD = 0.97  # Cosine similarity above which images are duplicates
+DEDUP_OVERFETCH = 3  # Search fetches top_k * this to fill slots after collapse
+QUERY_LOG_PATH = DIR_PATH + "/" + "data/query_counts.json"
+QUERY_LOG_FLUSH_SECONDS = 60  # How often the API persists query counts
+QUERY_LOG_MAX_QUERIES = 10000  # Distinct queries kept in the log (most frequent)
+QUERY_LOG_HALF_LIFE_DAYS = 7  # Logged counts halve over this many days
+PRECOMPUTED_RESULTS_PATH = DIR_PATH + "/" + "data/precomputed_results.json"
+PRECOMPUTE_TOP_N = 200  # Most frequent queries precomputed after a refresh
+PRECOMPUTE_TOP_K = 20  # Results stored per precomputed query
+STALE_AFTER_DAYS = 14  # Evict items not seen by the scraper for this long
+REFRESH_STATS_PATH = DIR_PATH + "/" + "data/refresh_stats.json"
+COMPACT_DIM = 0  # PCA dimension of the compact search index (0 disables it)
+COMPACT_DTYPE = "float16"  # Re-ranking vectors: float16 or int8
+COMPACT_INDEX_PATH = DIR_PATH + "/" + "data/compact_index"
+RERANK_FACTOR = 4  # Compact index candidates re-ranked per result
+SERVING_REGISTRY_PATH = DIR_PATH + "/" + "data/serving"  # Versions each API serves
+SERVING_ACK_TTL = 300  # Seconds before a silent API stops protecting old versions
+LEXICAL_INDEX_PATH = DIR_PATH + "/" + "data/lexical_index"
+LEXICAL_MAX_SEGMENTS = 8  # Lexical index segments merged beyond this count
+SEARCH_MODE = "vector"  # Default search mode: vector or hybrid (vector + BM25)
+RRF_K = 60  # Reciprocal rank fusion constant for hybrid search
+INGEST_TORCH_THREADS = 0  # Intra-op threads of the refresh job (0: half the CPUs)
+INGEST_INTEROP_THREADS = 0  # Inter-op threads of the refresh job (0: torch default)
+INGEST_CPU_AFFINITY = ""  # CPUs the refresh job runs on, e.g. "2-3" (all if empty)
+INGEST_PRIORITY = "nice"  # normal, nice or idle (only runs on CPU search leaves)
+INGEST_NICE = 10  # Niceness added to the refresh job with INGEST_PRIORITY=nice
+SCRAPE_RECORD_PATH = ""  # Save raw page responses of each crawl here (off if empty)
 MAX_RETRIES = 3
 PAUSE_RANGE = (1.0, 2.5)  # Random pause between requests
 
@@ -36,10 +67,18 @@ PAUSE_RANGE = (1.0, 2.5)  # Random pause between requests
 API_HOST = "0.0.0.0"
 API_PORT = 8000
 API_WORKERS = 1
+SEARCH_MAX_WORKERS = 8  # Threads querying catalog shards concurrently
+SEARCH_TORCH_THREADS = 0  # Intra-op threads of the API (0: all CPUs)
+SEARCH_INTEROP_THREADS = 0  # Inter-op threads of the API (0: torch default)
+SEARCH_CPU_AFFINITY = ""  # CPUs the API runs on, e.g. "0-1" (all if empty)
+
+# Metrics Configuration
+TIMING_HEADERS = False  # Add a Server-Timing header with stage durations
 
 # Logging Configuration
 LOG_LEVEL = "INFO"
 LOG_FORMAT = "[%(levelname)s] %(message)s"
+LOG_SAMPLE_RATE = 1.0  # Fraction of per-request log lines kept
 
 # User Agents for scraping
 USER_AGENTS = [
@@ -61,6 +100,18 @@ def get_config():
         # Catalog
         "catalog_ids": CATALOG_IDS,
         "default_catalog_id": int(os.getenv("DEFAULT_CATALOG_ID", DEFAULT_CATALOG_ID)),
+        "default_catalog": os.getenv("DEFAULT_CATALOG", DEFAULT_CATALOG),
+        "shard_collection_template": os.getenv(
+            "SHARD_COLLECTION_TEMPLATE", SHARD_COLLECTION_TEMPLATE
+        ),
+        "search_catalogs": [
+            catalog
+            for catalog in os.getenv(
+                "SEARCH_CATALOGS", ",".join(CATALOG_IDS)
+            ).split(",")
+            if catalog
+        ],
+        "search_max_workers": int(os.getenv("SEARCH_MAX_WORKERS", SEARCH_MAX_WORKERS)),
         # Scraping
         "vinted_base_url": os.getenv("VINTED_BASE_URL", VINTED_BASE_URL),
         "vinted_api_endpoint": os.getenv("VINTED_API_ENDPOINT", VINTED_API_ENDPOINT),
@@ -68,6 +119,51 @@ def get_config():
         "max_pages": int(os.getenv("MAX_PAGES", MAX_PAGES)),
         "items_per_page": int(os.getenv("ITEMS_PER_PAGE", ITEMS_PER_PAGE)),
         "batch_size": int(os.getenv("BATCH_SIZE", BATCH_SIZE)),
+        "write_chunk_size": int(os.getenv("WRITE_CHUNK_SIZE", WRITE_CHUNK_SIZE)),
+        "checkpoint_path": os.getenv("CHECKPOINT_PATH", CHECKPOINT_PATH),
+        "dedup_threshold": float(os.getenv("DEDUP_THRESHOLD", DEDUP_THRESHOLD)),
+        "dedup_overfetch": int(os.getenv("DEDUP_OVERFETCH", DEDUP_OVERFETCH)),
+        "query_log_path": os.getenv("QUERY_LOG_PATH", QUERY_LOG_PATH),
+        "query_log_flush_seconds": float(
+            os.getenv("QUERY_LOG_FLUSH_SECONDS", QUERY_LOG_FLUSH_SECONDS)
+        ),
+        "query_log_max_queries": int(
+            os.getenv("QUERY_LOG_MAX_QUERIES", QUERY_LOG_MAX_QUERIES)
+        ),
+        "query_log_half_life_days": float(
+            os.getenv("QUERY_LOG_HALF_LIFE_DAYS", QUERY_LOG_HALF_LIFE_DAYS)
+        ),
+        "precomputed_results_path": os.getenv(
+            "PRECOMPUTED_RESULTS_PATH", PRECOMPUTED_RESULTS_PATH
+        ),
+        "precompute_top_n": int(os.getenv("PRECOMPUTE_TOP_N", PRECOMPUTE_TOP_N)),
+        "precompute_top_k": int(os.getenv("PRECOMPUTE_TOP_K", PRECOMPUTE_TOP_K)),
+        "stale_after_days": float(os.getenv("STALE_AFTER_DAYS", STALE_AFTER_DAYS)),
+        "refresh_stats_path": os.getenv("REFRESH_STATS_PATH", REFRESH_STATS_PATH),
+        "compact_dim": int(os.getenv("COMPACT_DIM", COMPACT_DIM)),
+        "compact_dtype": os.getenv("COMPACT_DTYPE", COMPACT_DTYPE),
+        "compact_index_path": os.getenv("COMPACT_INDEX_PATH", COMPACT_INDEX_PATH),
+        "rerank_factor": int(os.getenv("RERANK_FACTOR", RERANK_FACTOR)),
+        "serving_registry_path": os.getenv(
+            "SERVING_REGISTRY_PATH", SERVING_REGISTRY_PATH
+        ),
+        "serving_ack_ttl": float(os.getenv("SERVING_ACK_TTL", SERVING_ACK_TTL)),
+        "lexical_index_path": os.getenv("LEXICAL_INDEX_PATH", LEXICAL_INDEX_PATH),
+        "lexical_max_segments": int(
+            os.getenv("LEXICAL_MAX_SEGMENTS", LEXICAL_MAX_SEGMENTS)
+        ),
+        "search_mode": os.getenv("SEARCH_MODE", SEARCH_MODE),
+        "rrf_k": int(os.getenv("RRF_K", RRF_K)),
+        "ingest_torch_threads": int(
+            os.getenv("INGEST_TORCH_THREADS", INGEST_TORCH_THREADS)
+        ),
+        "ingest_interop_threads": int(
+            os.getenv("INGEST_INTEROP_THREADS", INGEST_INTEROP_THREADS)
+        ),
+        "ingest_cpu_affinity": os.getenv("INGEST_CPU_AFFINITY", INGEST_CPU_AFFINITY),
+        "ingest_priority": os.getenv("INGEST_PRIORITY", INGEST_PRIORITY),
+        "ingest_nice": int(os.getenv("INGEST_NICE", INGEST_NICE)),
+        "scrape_record_path": os.getenv("SCRAPE_RECORD_PATH", SCRAPE_RECORD_PATH),
         "max_retries": int(os.getenv("MAX_RETRIES", MAX_RETRIES)),
         "pause_range": (
             float(os.getenv("PAUSE_MIN", PAUSE_RANGE[0])),
@@ -77,9 +173,20 @@ def get_config():
         "api_host": os.getenv("API_HOST", API_HOST),
         "api_port": int(os.getenv("API_PORT", API_PORT)),
         "api_workers": int(os.getenv("API_WORKERS", API_WORKERS)),
+        "search_torch_threads": int(
+            os.getenv("SEARCH_TORCH_THREADS", SEARCH_TORCH_THREADS)
+        ),
+        "search_interop_threads": int(
+            os.getenv("SEARCH_INTEROP_THREADS", SEARCH_INTEROP_THREADS)
+        ),
+        "search_cpu_affinity": os.getenv("SEARCH_CPU_AFFINITY", SEARCH_CPU_AFFINITY),
+        # Metrics
+        "timing_headers": os.getenv("TIMING_HEADERS", str(TIMING_HEADERS)).lower()
+        == "true",
         # Logging
         "log_level": os.getenv("LOG_LEVEL", LOG_LEVEL),
         "log_format": os.getenv("LOG_FORMAT", LOG_FORMAT),
+        "log_sample_rate": float(os.getenv("LOG_SAMPLE_RATE", LOG_SAMPLE_RATE)),
         # User Agents
         "user_agents": os.getenv("USER_AGENTS", ",".join(USER_AGENTS)).split(","),
     }
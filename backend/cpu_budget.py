@@ -0,0 +1,138 @@
+"""
+CPU budgets for the two roles that run the CLIP model: the API ("search")
+and the refresh job ("ingest"). Each role gets its own torch thread counts
+and optional CPU affinity, so the two processes do not oversubscribe the
+cores of a shared container. Ingest can also run at a lower scheduling
+priority, so it only takes CPU time live searches are not using.
+
+Budgets are applied once per process, when the model is loaded and before
+torch starts its thread pools. By default the API uses every CPU, and the
+refresh job half of them at a lowered (nice) priority, so a refresh
+running next to the API leaves it most of the CPU time.
+"""
+
+import os
+import logging
+from typing import Any, Dict, List, Optional, Set
+
+import torch
+
+from config import get_config
+
+config = get_config()
+
+logger = logging.getLogger(__name__)
+
+ROLES = ("search", "ingest")
+PRIORITIES = ("normal", "nice", "idle")
+
+_applied: Optional[Dict[str, Any]] = None  # Budget set in this process
+
+
+def parse_cpu_list(spec: str) -> Set[int]:
+    """CPU ids of a list such as "0-3,6" (empty for an empty string)"""
+    cpus: Set[int] = set()
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def default_torch_threads(role: str) -> int:
+    """Intra-op threads of `role` when none are configured"""
+    if role == "ingest":
+        return max(1, available_cpus() // 2)
+    return available_cpus()
+
+
+def _thread_ids() -> List[int]:
+    """
+    Ids of the threads of this process. On Linux affinity and priority are
+    per thread, and only threads started afterwards inherit them.
+    """
+    try:
+        return [int(tid) for tid in os.listdir("/proc/self/task")]
+    except OSError:
+        return [0]
+
+
+def _set_priority(priority: str) -> None:
+    """Lower the scheduling priority of this process's threads"""
+    for tid in _thread_ids():
+        try:
+            if priority == "nice":
+                niceness = os.getpriority(os.PRIO_PROCESS, tid)
+                os.setpriority(
+                    os.PRIO_PROCESS, tid, niceness + config["ingest_nice"]
+                )
+            elif priority == "idle":
+                # SCHED_IDLE threads only run when no other thread wants the CPU
+                os.sched_setscheduler(tid, os.SCHED_IDLE, os.sched_param(0))
+        except ProcessLookupError:
+            pass  # The thread exited meanwhile
+
+
+def apply_cpu_budget(role: str) -> Dict[str, Any]:
+    """
+    Set affinity, torch threads and priority for `role` in this process.
+    Later calls are no-ops, as torch only accepts thread settings before
+    its pools are started.
+    """
+    global _applied
+    if role not in ROLES:
+        raise ValueError(f"Unknown CPU budget role: {role}")
+    if _applied is not None:
+        if _applied["role"] != role:
+            logger.warning(
+                "CPU budget already set for %s, ignoring %s", _applied["role"], role
+            )
+        return _applied
+
+    affinity = parse_cpu_list(config[f"{role}_cpu_affinity"])
+    if affinity:
+        if hasattr(os, "sched_setaffinity"):
+            for tid in _thread_ids():
+                try:
+                    os.sched_setaffinity(tid, affinity)
+                except ProcessLookupError:
+                    pass
+        else:
+            logger.warning("CPU affinity is not supported on this platform")
+
+    threads = config[f"{role}_torch_threads"] or default_torch_threads(role)
+    torch.set_num_threads(threads)
+    interop_threads = config[f"{role}_interop_threads"]
+    if interop_threads:
+        try:
+            torch.set_interop_threads(interop_threads)
+        except RuntimeError as e:
+            # Raised once inter-op work has started in this process
+            logger.warning(f"Could not set torch interop threads: {e}")
+
+    priority = config["ingest_priority"] if role == "ingest" else "normal"
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown ingest priority: {priority}")
+    try:
+        _set_priority(priority)
+    except (AttributeError, OSError) as e:
+        logger.warning(f"Could not lower ingest priority to {priority}: {e}")
+        priority = "normal"
+
+    _applied = {
+        "role": role,
+        "torch_threads": torch.get_num_threads(),
+        "interop_threads": torch.get_num_interop_threads(),
+        "cpus": available_cpus(),
+        "priority": priority,
+    }
+    logger.info(f"CPU budget for {role}: {_applied}")
+    return _applied
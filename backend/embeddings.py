@@ -1,9 +1,11 @@
 import os
+import time
 import torch
 import json
 import re
 import numpy
 import logging
+from datetime import datetime
 from io import BytesIO
 from typing import List, Dict, Any, Optional, Union
 import requests
@@ -13,17 +15,51 @@ from transformers import CLIPProcessor, CLIPModel
 
 # from sentence_transformers import SentenceTransformer
 import chromadb
+from chromadb.errors import NotFoundError
 from tqdm import tqdm
 import cloudscraper
 from typing import List, Union, Optional, Dict, Any, Iterable
 
 from config import get_config
+from compact_index import CompactIndex
+from cpu_budget import apply_cpu_budget
+from lexical_index import LexicalIndex
+from vectors import l2_normalize
+from versions import ServingRegistry, read_manifest, write_manifest
+from metrics import INGEST_STAGE_SECONDS, SEARCH_STAGE_SECONDS, timed
 
 config = get_config()
 
-logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
 
+# Scraped column -> (metadata key, default when the column is missing)
+METADATA_COLUMNS = {
+    "TITLE": ("title", ""),
+    "TOTAL_ITEM_PRICE_AMOUNT": ("price", None),
+    "TOTAL_ITEM_PRICE_CURRENCY": ("currency", "EUR"),
+    "URL": ("url", ""),
+    "PHOTO_URL": ("image_url", None),
+    "SIZE": ("size", ""),
+    "BRAND": ("brand", ""),
+    "DESCRIPTION": ("description", ""),
+    "LAST_SEEN": ("last_seen", None),
+}
+
+
+def _price(value: Any) -> Optional[float]:
+    """Price as a float; items scraped live store the API's string amount"""
+    if value is None or isinstance(value, float):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def shard_collection_name(catalog: str) -> str:
+    """ChromaDB collection holding the items of one catalog"""
+    return config["shard_collection_template"].format(catalog=catalog)
+
 
 class ImageEmbedder:
     """Class to embedd data from vintedd and load embeddings into vector db"""
@@ -32,15 +68,32 @@ class ImageEmbedder:
         self,
         model_path: str = config["model_path"],
         chroma_path: str = config["chroma_db_path"],
+        write_chunk_size: int = config["write_chunk_size"],
+        checkpoint_path: str = config["checkpoint_path"],
+        dedup_threshold: float = config["dedup_threshold"],
+        collection_name: str = shard_collection_name(config["default_catalog"]),
     ):
         self.model_path = model_path
         self.chroma_path = chroma_path
+        self.write_chunk_size = write_chunk_size
+        self.checkpoint_path = checkpoint_path
+        self.dedup_threshold = dedup_threshold
         self.model = None
         self.client = None
         self.collection = None
-
-    def initialize_model(self):
-        """Initialize CLIP model locally"""
+        # Logical shard name; the manifest names the collection serving it
+        self.collection_name = collection_name
+        self._collection_manifest_mtime: Optional[float] = None
+        self.compact_index: Optional[CompactIndex] = None
+        self.lexical_index: Optional[LexicalIndex] = None
+        self.cpu_budget: Optional[Dict[str, Any]] = None  # Set with the model
+
+    def initialize_model(self, role: str = "ingest"):
+        """
+        Initialize CLIP model locally, after applying the CPU budget of
+        `role` ("search" for the API, "ingest" for refresh jobs)
+        """
+        self.cpu_budget = apply_cpu_budget(role)
         try:
             logger.info("Loading local CLIP model...")
             self.processor = CLIPProcessor.from_pretrained(
@@ -54,22 +107,278 @@ class ImageEmbedder:
             logger.error(f"Failed to load local CLIP model: {e}")
             raise
 
-    def initialize_database(self, collection_name: str = "vinted_dresses_db"):
-        """Initialize ChromaDB client and collection"""
+    def initialize_database(
+        self, collection_name: Optional[str] = None, open_collection: bool = True
+    ):
+        """
+        Initialize ChromaDB client and collection. Without `open_collection`,
+        only the client is created, e.g. to serve from the compact index.
+        """
         try:
             os.makedirs(self.chroma_path, exist_ok=True)
             logger.info("Connecting to ChromaDB...")
             self.client = chromadb.PersistentClient(path=self.chroma_path)
-            self.collection = self.client.get_or_create_collection(
-                collection_name, metadata={"hnsw:space": "cosine"}
-            )
-            logger.info(
-                f"ChromaDB connected. Collection has {self.collection.count()} items"
-            )
+            self.collection_name = collection_name or self.collection_name
+            if open_collection:
+                self.open_collection()
+                logger.info(
+                    f"ChromaDB connected. Collection has {self.collection.count()} "
+                    "items"
+                )
         except Exception as e:
             logger.error(f"Failed to initialize database: {e}")
             raise
 
+    def open_collection(self, create: bool = True) -> bool:
+        """
+        Open the full collection of this shard, creating it unless `create`
+        is off. Returns False if it does not exist and was not created.
+        """
+        name = self._current_collection_name()
+        if not create:
+            try:
+                self.collection = self.client.get_collection(name)
+            except NotFoundError:
+                return False
+            return True
+        self.collection = self.client.get_or_create_collection(
+            name, metadata={"hnsw:space": "cosine"}
+        )
+        return True
+
+    @property
+    def serving_collection(self):
+        """Collection searches read: the compact one when it is loaded"""
+        if self.compact_index is not None:
+            return self.compact_index.collection
+        return self.collection
+
+    @property
+    def collection_manifest_path(self) -> str:
+        return os.path.join(
+            self.chroma_path, "manifests", f"{self.collection_name}.json"
+        )
+
+    def _current_collection_name(self) -> str:
+        """
+        Collection currently serving this shard: the last rebuild named in
+        the manifest, or the shard name itself if it was never rebuilt
+        """
+        try:
+            self._collection_manifest_mtime = os.stat(
+                self.collection_manifest_path
+            ).st_mtime
+        except OSError:
+            self._collection_manifest_mtime = None
+        manifest = read_manifest(self.collection_manifest_path) or {}
+        return manifest.get("collection", self.collection_name)
+
+    def reload_collection_if_changed(self) -> None:
+        """Switch to the collection a rebuild in another process swapped in"""
+        if self.collection is None:
+            return
+        try:
+            mtime = os.stat(self.collection_manifest_path).st_mtime
+        except OSError:
+            return
+        if mtime == self._collection_manifest_mtime:
+            return
+        try:
+            self.collection = self.client.get_collection(
+                self._current_collection_name()
+            )
+            logger.info(f"Switched to collection {self.collection.name}")
+        except Exception as e:
+            logger.warning(f"Could not switch to the rebuilt collection: {e}")
+
+    def shard_path(self, base_path: str) -> str:
+        """Directory under `base_path` for this collection's side indexes"""
+        return os.path.join(base_path, self.collection_name)
+
+    def load_compact_index(self, index: Optional[CompactIndex] = None) -> bool:
+        """
+        Serve searches from the compact (PCA + re-rank) index if one has been
+        built by the refresh job: vectors come from its re-rank store and
+        metadata from its collection, so the full collection is not needed.
+        Returns False, keeping the full collection, otherwise.
+        """
+        if self.client is None:
+            raise RuntimeError("Database must be initialized first")
+        index = index or CompactIndex(
+            path=self.shard_path(config["compact_index_path"])
+        )
+        try:
+            if not index.load(self.client):
+                logger.info("No compact index built yet, using the full collection")
+                return False
+        except Exception as e:
+            logger.warning(f"Could not load compact index: {e}")
+            return False
+        self.compact_index = index
+        return True
+
+    def load_lexical_index(self, index: Optional[LexicalIndex] = None) -> bool:
+        """
+        Enable hybrid search with the BM25 index built by the refresh job.
+        Returns False, leaving hybrid searches vector-only, if none is built.
+        """
+        index = index or LexicalIndex(
+            path=self.shard_path(config["lexical_index_path"])
+        )
+        try:
+            if not index.load():
+                logger.info("No lexical index built yet, hybrid search disabled")
+                return False
+        except Exception as e:
+            logger.warning(f"Could not load lexical index: {e}")
+            return False
+        self.lexical_index = index
+        return True
+
+    def _query(self, query_vectors: numpy.ndarray, n_results: int) -> Dict[str, Any]:
+        """Nearest neighbours from the compact index if loaded, else the collection"""
+        if self.compact_index is None:
+            with timed(SEARCH_STAGE_SECONDS, "chroma_query"):
+                return self.collection.query(
+                    query_embeddings=query_vectors,
+                    n_results=n_results,
+                    include=["metadatas", "distances"],
+                )
+        with timed(SEARCH_STAGE_SECONDS, "chroma_query"):
+            candidates = self.compact_index.candidates(query_vectors, n_results)
+        with timed(SEARCH_STAGE_SECONDS, "rerank"):
+            return self.compact_index.rerank(query_vectors, candidates, n_results)
+
+    @staticmethod
+    def valid_items_mask(items_df: pd.DataFrame) -> pd.Series:
+        """Boolean mask of rows that have both an item ID and a photo URL"""
+        ids = items_df["ID"]
+        urls = items_df["PHOTO_URL"]
+        return (
+            ids.notna()
+            & (ids.astype(str) != "")
+            & urls.notna()
+            & (urls.astype(str) != "")
+        )
+
+    @staticmethod
+    def build_metadata_records(items_df: pd.DataFrame) -> List[Dict[str, Any]]:
+        """Build the ChromaDB metadata dict of every row, column by column"""
+        columns = {
+            key: items_df[column] if column in items_df else default
+            for column, (key, default) in METADATA_COLUMNS.items()
+        }
+        return pd.DataFrame(columns, index=items_df.index).to_dict("records")
+
+    def load_checkpoint(self) -> set:
+        """Return IDs already committed by an interrupted ingest run"""
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return set()
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            return {line.strip() for line in f if line.strip()}
+
+    def clear_checkpoint(self) -> None:
+        """Forget ingest progress once a run has completed"""
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def _record_checkpoint(self, ids: List[str]) -> None:
+        """Append committed IDs to the checkpoint file and flush them to disk"""
+        if not self.checkpoint_path:
+            return
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        with open(self.checkpoint_path, "a", encoding="utf-8") as f:
+            f.write("".join(f"{item_id}\n" for item_id in ids))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_chunk(
+        self,
+        ids: List[str],
+        embeddings: List[numpy.ndarray],
+        metadatas: List[Dict[str, Any]],
+    ) -> int:
+        """
+        Upsert buffered embeddings (a list of per-batch arrays) into ChromaDB,
+        then checkpoint their IDs
+        """
+        if not ids:
+            return 0
+        vectors = numpy.concatenate(embeddings)
+        with timed(INGEST_STAGE_SECONDS, "dedup"):
+            self.assign_duplicate_groups(ids, vectors, metadatas)
+        # ChromaDB rejects writes larger than its own max batch size
+        max_batch_size = self.client.get_max_batch_size() if self.client else None
+        step = min(len(ids), max_batch_size or len(ids))
+        for start in range(0, len(ids), step):
+            end = start + step
+            try:
+                with timed(INGEST_STAGE_SECONDS, "db_write"):
+                    self.collection.upsert(
+                        ids=ids[start:end],
+                        embeddings=vectors[start:end],
+                        metadatas=metadatas[start:end],
+                    )
+            except Exception as e:
+                logger.error(f"Failed to write {len(ids[start:end])} items: {e}")
+                raise
+            self._record_checkpoint(ids[start:end])
+        written = len(ids)
+        ids.clear()
+        embeddings.clear()
+        metadatas.clear()
+        return written
+
+    def assign_duplicate_groups(
+        self,
+        ids: List[str],
+        vectors: numpy.ndarray,
+        metadatas: List[Dict[str, Any]],
+    ) -> None:
+        """
+        Set `dup_group` in each metadata dict: the group of the first image,
+        already indexed or earlier in this chunk, whose cosine similarity is
+        at least `dedup_threshold`, otherwise the item's own ID.
+        `vectors` are the chunk's unit-length embeddings, one row per ID.
+        """
+        groups = list(ids)
+        matched = [False] * len(ids)
+
+        # Near-duplicates of already indexed items (one batched ANN query)
+        if self.collection.count() > 0:
+            nearest = self.collection.query(
+                query_embeddings=vectors,
+                n_results=1,
+                include=["metadatas", "distances"],
+            )
+            for i, (hit_ids, distances, hit_metadatas) in enumerate(
+                zip(nearest["ids"], nearest["distances"], nearest["metadatas"])
+            ):
+                if hit_ids and 1 - distances[0] >= self.dedup_threshold:
+                    groups[i] = (hit_metadatas[0] or {}).get("dup_group", hit_ids[0])
+                    matched[i] = True
+
+        # Near-duplicates within the chunk itself
+        similarities = vectors @ vectors.T
+        for i in range(len(ids)):
+            if matched[i]:
+                continue
+            earlier = numpy.flatnonzero(similarities[i, :i] >= self.dedup_threshold)
+            if earlier.size:
+                groups[i] = groups[earlier[0]]
+
+        for metadata, group in zip(metadatas, groups):
+            metadata["dup_group"] = group
+
+    @staticmethod
+    def load_image(content: bytes) -> Image.Image:
+        """Open image bytes, fix EXIF rotation, ensure RGB and resize"""
+        ImageFile.LOAD_TRUNCATED_IMAGES = True  # allows loading incomplete images
+
+        image = Image.open(BytesIO(content))
+        image.load()
+        return ImageOps.exif_transpose(image).convert("RGB").resize((224, 224))
+
     def process_batch_embeddings(
         self, items_df: pd.DataFrame, batch_size: int = 6
     ) -> int:
@@ -78,110 +387,99 @@ class ImageEmbedder:
         - Handles invalid or corrupt images safely.
         - Forces consistent image size and mode (RGB, 224x224).
         - Processes data in batches for efficiency.
+        - Buffers embeddings and upserts them every `write_chunk_size` items,
+          checkpointing committed IDs so an interrupted run can resume.
+        - Keeps embeddings as unit-length float32 arrays from the model to
+          ChromaDB, without converting them to Python lists.
         """
         if self.model is None or self.collection is None:
             raise RuntimeError("Model and database must be initialized first.")
 
+        items_df = items_df[self.valid_items_mask(items_df)]
+        item_ids = items_df["ID"].astype(str).to_numpy()
+        image_urls = items_df["PHOTO_URL"].to_numpy()
+        item_metadatas = self.build_metadata_records(items_df)
+
         added_count = 0
         total_items = len(items_df)
         logger.info(f"Processing {total_items} items in batches of {batch_size}")
+        pending_ids, pending_embeddings, pending_metadatas = [], [], []
 
         for start_idx in tqdm(
             range(0, total_items, batch_size), desc="Processing batches"
         ):
             end_idx = min(start_idx + batch_size, total_items)
-            batch = items_df.iloc[start_idx:end_idx]
 
             images, ids, metadatas = [], [], []
 
             # --- Load and preprocess images ---
-            for _, row in batch.iterrows():
-                image_url = row.get("PHOTO_URL")
-                item_id = str(row.get("ID"))
-
-                if (
-                    not image_url
-                    or pd.isna(image_url)
-                    or not item_id
-                    or item_id == "nan"
-                ):
-                    continue
-
+            for item_id, image_url, metadata in zip(
+                item_ids[start_idx:end_idx],
+                image_urls[start_idx:end_idx],
+                item_metadatas[start_idx:end_idx],
+            ):
                 try:
-                    response = requests.get(image_url, timeout=8)
+                    with timed(INGEST_STAGE_SECONDS, "download"):
+                        response = requests.get(image_url, timeout=8)
                     if response.status_code != 200:
                         continue
 
-                    # Open, fix EXIF rotation, ensure RGB and resize
-                    ImageFile.LOAD_TRUNCATED_IMAGES = (
-                        True  # allows loading incomplete images
-                    )
-
-                    image = Image.open(BytesIO(response.content))
-                    image.load()
-                    image = (
-                        ImageOps.exif_transpose(image).convert("RGB").resize((224, 224))
-                    )
-
-                    images.append(image)
+                    with timed(INGEST_STAGE_SECONDS, "decode"):
+                        images.append(self.load_image(response.content))
                     ids.append(item_id)
-                    metadatas.append(
-                        {
-                            "title": row.get("TITLE", ""),
-                            "price": row.get("TOTAL_ITEM_PRICE_AMOUNT"),
-                            "currency": row.get("TOTAL_ITEM_PRICE_CURRENCY", "EUR"),
-                            "url": row.get("URL", ""),
-                            "image_url": image_url,
-                            "size": row.get("SIZE", ""),
-                            "brand": row.get("BRAND", ""),
-                        }
-                    )
+                    metadatas.append(metadata)
 
                 except Exception as e:
-                    logger.warning(f"Error loading image for item {item_id}: {e}")
+                    logger.warning("Error loading image for item %s: %s", item_id, e)
                     continue
 
             if not images:
-                logger.warning(f"No valid images in batch {start_idx}-{end_idx}")
+                logger.warning("No valid images in batch %d-%d", start_idx, end_idx)
                 continue
 
             try:
                 # --- Create CLIP embeddings ---
-                inputs = self.processor(
-                    images=images, return_tensors="pt"
-                )  # consistent batch
-                with torch.no_grad():
+                with timed(INGEST_STAGE_SECONDS, "preprocess"):
+                    inputs = self.processor(
+                        images=images, return_tensors="pt"
+                    )  # consistent batch
+                with timed(INGEST_STAGE_SECONDS, "inference"), torch.no_grad():
                     outputs = self.model.get_image_features(**inputs)
-                    embeddings = outputs.cpu().tolist()
+                    embeddings = l2_normalize(outputs.cpu().numpy())
 
-                # --- Store in ChromaDB ---
-                self.collection.add(
-                    ids=ids,
-                    embeddings=embeddings,
-                    metadatas=metadatas,
-                )
-
-                added_count += len(ids)
-                logger.info(
-                    f"Added {len(ids)} items to database (total so far: {added_count})"
-                )
+                pending_ids.extend(ids)
+                pending_embeddings.append(embeddings)
+                pending_metadatas.extend(metadatas)
 
             except Exception as e:
-                logger.error(f"Error processing batch {start_idx}-{end_idx}: {e}")
+                logger.error("Error processing batch %d-%d: %s", start_idx, end_idx, e)
                 continue
 
+            # --- Store in ChromaDB ---
+            if len(pending_ids) >= self.write_chunk_size:
+                added_count += self._write_chunk(
+                    pending_ids, pending_embeddings, pending_metadatas
+                )
+                logger.info("Wrote chunk to database (total so far: %d)", added_count)
+
+        added_count += self._write_chunk(
+            pending_ids, pending_embeddings, pending_metadatas
+        )
         logger.info(f"Completed embedding generation. Added {added_count} items total.")
         return added_count
 
     def embedd_data(
         self,
         items_df: pd.DataFrame,
+        batch_size: int = config["batch_size"],
     ) -> int:
         """Main function to create embeddings"""
 
-        # Initialize components
-        self.initialize_model()
-        self.initialize_database(collection_name="vinted_dresses_db")
+        # Initialize components not set up by the caller
+        if self.model is None:
+            self.initialize_model()
+        if self.collection is None:
+            self.initialize_database()
 
         # Remove duplicates and invalid items
         items_df = items_df.dropna(subset=["ID", "PHOTO_URL"])
@@ -198,64 +496,495 @@ class ImageEmbedder:
         except Exception as e:
             logger.warning(f"Could not check existing items: {e}")
 
+        # Scraped items are still listed: refresh their last-seen timestamp
+        # (CSVs saved before last_seen was tracked have no value for it)
+        now = int(time.time())
+        if "LAST_SEEN" not in items_df:
+            items_df = items_df.assign(LAST_SEEN=now)
+        else:
+            items_df = items_df.assign(
+                LAST_SEEN=items_df["LAST_SEEN"].fillna(now).astype(int)
+            )
+        self.touch_items(items_df[items_df["ID"].astype(str).isin(existing_ids)])
+
         # Filter out existing items
         new_items_df = items_df[~items_df["ID"].astype(str).isin(existing_ids)]
         logger.info(f"Processing {len(new_items_df)} new items")
 
         if len(new_items_df) == 0:
             logger.info("No new items to process")
+            # A crash after the last commit leaves a checkpoint with nothing left
+            self.clear_checkpoint()
             return 0
 
         # Process embeddings
         new_items_df = items_df  # For now, process all items
-        added_count = self.process_batch_embeddings(new_items_df, batch_size=6)
+
+        # Resume an interrupted run: skip items committed before the crash
+        committed_ids = self.load_checkpoint()
+        if committed_ids:
+            new_items_df = new_items_df[
+                ~new_items_df["ID"].astype(str).isin(committed_ids)
+            ]
+            logger.info(
+                f"Resuming from checkpoint: skipping {len(committed_ids)} "
+                f"committed items, {len(new_items_df)} left"
+            )
+
+        added_count = self.process_batch_embeddings(new_items_df, batch_size=batch_size)
+        self.clear_checkpoint()
 
         logger.info(f"Successfully added {added_count} new items to database")
         logger.info(f"Total items in database: {self.collection.count()}")
 
         return added_count
 
-    def search_similar(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
-        """Search for similar items using text query"""
-        if self.model is None or self.collection is None:
-            raise RuntimeError("Model and database must be initialized first")
+    def touch_items(self, items_df: pd.DataFrame) -> int:
+        """Update the last_seen metadata of already indexed items"""
+        if items_df.empty:
+            return 0
+        ids = items_df["ID"].astype(str).tolist()
+        now = int(time.time())
+        metadatas = [
+            {"last_seen": int(ts) if pd.notna(ts) else now}
+            for ts in items_df["LAST_SEEN"]
+        ]
+        step = self.client.get_max_batch_size()
+        for start in range(0, len(ids), step):
+            self.collection.update(
+                ids=ids[start : start + step],
+                metadatas=metadatas[start : start + step],
+            )
+        logger.info(f"Refreshed last_seen for {len(ids)} existing items")
+        return len(ids)
 
-        try:
-            # Encode the query text using the CLIP model
-            inputs = self.processor(text=[query], return_tensors="pt", padding=True)
+    def evict_stale_items(self, max_age_days: float) -> int:
+        """
+        Delete items the scraper has not seen for `max_age_days`.
+        Items indexed before last_seen was tracked are stamped with the
+        current time, so they expire one window after the first eviction.
+        """
+        if self.collection is None:
+            raise RuntimeError("Database must be initialized first")
 
-            with torch.no_grad():
-                text_features = self.model.get_text_features(**inputs)
-                query_embedding = text_features[0].cpu().tolist()
+        now = int(time.time())
+        cutoff = now - max_age_days * 86400
+        step = self.client.get_max_batch_size()
+        stale_ids, unstamped_ids = [], []
 
-            # Search in ChromaDB
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=top_k,
-                include=["metadatas", "distances"],
+        for offset in range(0, self.collection.count(), step):
+            page = self.collection.get(
+                include=["metadatas"], limit=step, offset=offset
+            )
+            for item_id, metadata in zip(page["ids"], page["metadatas"]):
+                last_seen = (metadata or {}).get("last_seen")
+                if last_seen is None:
+                    unstamped_ids.append(item_id)
+                elif last_seen < cutoff:
+                    stale_ids.append(item_id)
+
+        for start in range(0, len(unstamped_ids), step):
+            chunk = unstamped_ids[start : start + step]
+            self.collection.update(
+                ids=chunk, metadatas=[{"last_seen": now}] * len(chunk)
+            )
+        for start in range(0, len(stale_ids), step):
+            self.collection.delete(ids=stale_ids[start : start + step])
+
+        logger.info(
+            f"Evicted {len(stale_ids)} items not seen for {max_age_days} days "
+            f"({len(unstamped_ids)} untracked items stamped)"
+        )
+        return len(stale_ids)
+
+    def rebuild_collection(self) -> None:
+        """
+        Copy the collection into a fresh, versioned one and switch the
+        manifest to it, dropping the deleted entries the HNSW index keeps
+        after evictions. The previous collection is left for APIs still
+        serving it, and retired by retire_superseded_collections.
+        """
+        if self.collection is None:
+            raise RuntimeError("Database must be initialized first")
+
+        previous = self.collection
+        version = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        name = f"{self.collection_name}_v{version}"
+        rebuilt = self.client.create_collection(name, metadata=previous.metadata)
+
+        step = self.client.get_max_batch_size()
+        for offset in range(0, previous.count(), step):
+            page = previous.get(
+                include=["embeddings", "metadatas"], limit=step, offset=offset
+            )
+            rebuilt.add(
+                ids=page["ids"],
+                embeddings=page["embeddings"],
+                metadatas=page["metadatas"],
             )
 
-            # Format results
-            search_results = []
-            if results["ids"] and len(results["ids"][0]) > 0:
+        manifest = read_manifest(self.collection_manifest_path) or {}
+        superseded = manifest.get("superseded", {})
+        superseded[previous.name] = time.time()
+        write_manifest(
+            self.collection_manifest_path,
+            {
+                "collection": name,
+                "built_at": datetime.now().isoformat(),
+                "superseded": superseded,
+            },
+        )
+        self.collection = self.client.get_collection(name)
+        self._collection_manifest_mtime = os.stat(
+            self.collection_manifest_path
+        ).st_mtime
+        logger.info(f"Rebuilt collection {name} with {self.collection.count()} items")
+
+    def retire_superseded_collections(
+        self, registry: Optional[ServingRegistry] = None
+    ) -> List[str]:
+        """
+        Delete collections replaced by a rebuild once no API serves them.
+        Returns the names of the deleted collections.
+        """
+        manifest = read_manifest(self.collection_manifest_path)
+        if not manifest or not manifest.get("superseded"):
+            return []
+        registry = registry or ServingRegistry()
+        retired = registry.retirable(manifest["superseded"])
+        for name in retired:
+            try:
+                self.client.delete_collection(name)
+            except Exception as e:
+                logger.warning(f"Could not delete collection {name}: {e}")
+            del manifest["superseded"][name]
+        if retired:
+            write_manifest(self.collection_manifest_path, manifest)
+            self._collection_manifest_mtime = os.stat(
+                self.collection_manifest_path
+            ).st_mtime
+            logger.info(f"Retired superseded collections {retired}")
+        return retired
+
+    def _fuse_hybrid(
+        self,
+        query: str,
+        query_vector: numpy.ndarray,
+        results: Dict[str, Any],
+        n_results: int,
+    ) -> Dict[str, Any]:
+        """
+        Merge a single-query vector result with BM25 matches of `query` by
+        reciprocal rank fusion. Lexical-only hits get their cosine similarity
+        from the stored embeddings, so `similarity` stays a vector score; the
+        fused scores are returned under "scores".
+        """
+        lexical_ids: List[str] = []
+        if self.lexical_index is not None and query:
+            with timed(SEARCH_STAGE_SECONDS, "lexical"):
+                lexical_ids = self.lexical_index.search(query, n_results)
+
+        with timed(SEARCH_STAGE_SECONDS, "fuse"):
+            rrf_k = config["rrf_k"]
+            scores: Dict[str, float] = {}
+            for ranked_ids in (results["ids"][0], lexical_ids):
+                for rank, item_id in enumerate(ranked_ids):
+                    scores[item_id] = scores.get(item_id, 0.0) + 1 / (rrf_k + rank + 1)
+            fused = sorted(scores, key=scores.get, reverse=True)[:n_results]
+
+            hits = {
+                item_id: (distance, metadata)
                 for item_id, distance, metadata in zip(
                     results["ids"][0], results["distances"][0], results["metadatas"][0]
-                ):
-                    similarity = 1 - distance if distance <= 1 else 0
-                    search_results.append(
-                        {
-                            "id": item_id,
-                            "title": metadata.get("title", ""),
-                            "price": metadata.get("price"),
-                            "currency": metadata.get("currency", "EUR"),
-                            "url": metadata.get("url", ""),
-                            "image_url": metadata.get("image_url", ""),
-                            "similarity": round(similarity, 3),
-                        }
+                )
+            }
+            missing = [item_id for item_id in fused if item_id not in hits]
+            if missing:
+                stored = self._get_stored(missing)
+                if stored["ids"]:
+                    similarities = l2_normalize(stored["embeddings"]) @ query_vector
+                    for item_id, similarity, metadata in zip(
+                        stored["ids"], similarities, stored["metadatas"]
+                    ):
+                        hits[item_id] = (1.0 - float(similarity), metadata)
+
+            # Evicted items can linger in the lexical index until the next sync
+            fused = [item_id for item_id in fused if item_id in hits]
+            return {
+                "ids": [fused],
+                "distances": [[hits[item_id][0] for item_id in fused]],
+                "metadatas": [[hits[item_id][1] for item_id in fused]],
+                "scores": [[scores[item_id] for item_id in fused]],
+            }
+
+    def encode_text(self, queries: List[str]) -> numpy.ndarray:
+        """Unit-length CLIP text embeddings, one row per query"""
+        if self.model is None:
+            raise RuntimeError("Model must be initialized first")
+        with timed(SEARCH_STAGE_SECONDS, "tokenize"):
+            inputs = self.processor(text=queries, return_tensors="pt", padding=True)
+        with timed(SEARCH_STAGE_SECONDS, "text_forward"), torch.no_grad():
+            text_features = self.model.get_text_features(**inputs)
+            return l2_normalize(text_features.cpu().numpy())
+
+    def encode_image(self, images: List[Image.Image]) -> numpy.ndarray:
+        """Unit-length CLIP image embeddings, one row per image"""
+        if self.model is None:
+            raise RuntimeError("Model must be initialized first")
+        with timed(SEARCH_STAGE_SECONDS, "preprocess"):
+            inputs = self.processor(images=images, return_tensors="pt")
+        with timed(SEARCH_STAGE_SECONDS, "image_forward"), torch.no_grad():
+            image_features = self.model.get_image_features(**inputs)
+            return l2_normalize(image_features.cpu().numpy())
+
+    def _get_stored(self, ids: List[str]) -> Dict[str, Any]:
+        """Embeddings and metadata of indexed items, from the compact index if loaded"""
+        if self.compact_index is not None:
+            return self.compact_index.get(ids)
+        return self.collection.get(ids=ids, include=["embeddings", "metadatas"])
+
+    def get_item(self, item_id: str) -> Optional[Dict[str, Any]]:
+        """Stored embedding and metadata of an item, or None if not indexed"""
+        if self.serving_collection is None:
+            raise RuntimeError("Database must be initialized first")
+        with timed(SEARCH_STAGE_SECONDS, "chroma_get"):
+            stored = self._get_stored([item_id])
+        if not stored["ids"]:
+            return None
+        return {
+            "embedding": numpy.asarray(stored["embeddings"][0], dtype=numpy.float32),
+            "metadata": stored["metadatas"][0] or {},
+        }
+
+    def search_vectors(
+        self,
+        query_vectors: numpy.ndarray,
+        top_k: int = 5,
+        collapse_duplicates: bool = True,
+        mode: str = "vector",
+        queries: Optional[List[str]] = None,
+        exclude_ids: Iterable[str] = (),
+        with_scores: bool = False,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search this collection with already encoded queries, one result
+        list per row of `query_vectors`. Hybrid mode needs the query texts.
+        With `with_scores`, each result also has the "score" it is ranked by:
+        its similarity, or its fused score in hybrid mode.
+        """
+        if self.serving_collection is None:
+            raise RuntimeError("Database must be initialized first")
+
+        exclude_ids = set(exclude_ids)
+        # Over-fetch to refill slots of collapsed duplicates and excluded items
+        n_results = top_k
+        if collapse_duplicates:
+            n_results *= config["dedup_overfetch"]
+        if exclude_ids:
+            n_results += 1
+
+        search_results: List[Optional[List[Dict[str, Any]]]] = [None] * len(
+            query_vectors
+        )
+        pending = list(range(len(query_vectors)))
+        collection_size: Optional[int] = None
+        while pending:
+            results = self._query(query_vectors[pending], n_results)
+            short = []
+            for row, i in enumerate(pending):
+                query_results = {
+                    "ids": [results["ids"][row]],
+                    "distances": [results["distances"][row]],
+                    "metadatas": [results["metadatas"][row]],
+                }
+                formatted = self._format_query_results(
+                    query_results,
+                    query_vectors[i],
+                    queries[i] if queries else "",
+                    top_k,
+                    n_results,
+                    collapse_duplicates,
+                    mode,
+                    exclude_ids,
+                    with_scores,
+                )
+                search_results[i] = formatted
+                # Collapsing (e.g. the excluded item's whole duplicate group)
+                # can leave fewer than top_k: fetch more if there are more
+                if len(formatted) < top_k and len(query_results["ids"][0]) >= n_results:
+                    short.append(i)
+            if short:
+                if collection_size is None:
+                    collection_size = self.serving_collection.count()
+                if n_results >= collection_size:
+                    break
+                n_results = min(n_results * 2, collection_size)
+            pending = short
+        return search_results
+
+    def _format_query_results(
+        self,
+        query_results: Dict[str, Any],
+        query_vector: numpy.ndarray,
+        query: str,
+        top_k: int,
+        n_results: int,
+        collapse_duplicates: bool,
+        mode: str,
+        exclude_ids: Iterable[str],
+        with_scores: bool,
+    ) -> List[Dict[str, Any]]:
+        """Results of one query of search_vectors, fused in hybrid mode"""
+        if mode == "hybrid":
+            # Without a lexical index, fusion scores the vector ranks alone
+            query_results = self._fuse_hybrid(
+                query, query_vector, query_results, n_results
+            )
+        with timed(SEARCH_STAGE_SECONDS, "format"):
+            formatted = self._format_results(
+                query_results, top_k, collapse_duplicates, exclude_ids
+            )
+            if with_scores:
+                fused_scores: Dict[str, float] = {}
+                if "scores" in query_results:
+                    fused_scores = dict(
+                        zip(query_results["ids"][0], query_results["scores"][0])
+                    )
+                for result in formatted:
+                    result["score"] = fused_scores.get(
+                        result["id"], result["similarity"]
                     )
+        return formatted
 
-            return search_results
+    def search_similar(
+        self,
+        query: str,
+        top_k: int = 5,
+        collapse_duplicates: bool = True,
+        mode: str = config["search_mode"],
+    ) -> List[Dict[str, Any]]:
+        """
+        Search for similar items using text query.
+        With `collapse_duplicates`, near-duplicate listings (same dup_group)
+        are collapsed to their best-scoring representative.
+        With mode "hybrid", BM25 matches on title, brand and description are
+        fused with the vector results (when a lexical index is loaded).
+        """
+        if self.model is None or self.serving_collection is None:
+            raise RuntimeError("Model and database must be initialized first")
 
+        try:
+            query_vectors = self.encode_text([query])
+            return self.search_vectors(
+                query_vectors, top_k, collapse_duplicates, mode, queries=[query]
+            )[0]
         except Exception as e:
-            logger.error(f"Search error: {e}")
+            logger.error("Search error: %s", e)
             raise
+
+    def search_similar_batch(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        collapse_duplicates: bool = True,
+        mode: str = config["search_mode"],
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search several text queries at once: one batched text forward pass
+        and one batched ChromaDB query. Returns one result list per query.
+        """
+        if self.model is None or self.serving_collection is None:
+            raise RuntimeError("Model and database must be initialized first")
+        if not queries:
+            return []
+
+        query_vectors = self.encode_text(queries)
+        return self.search_vectors(
+            query_vectors, top_k, collapse_duplicates, mode, queries=queries
+        )
+
+    def search_by_item(
+        self, item_id: str, top_k: int = 5, collapse_duplicates: bool = True
+    ) -> List[Dict[str, Any]]:
+        """
+        Search for items similar to an already indexed one.
+        Reuses the stored image embedding, so no model inference is needed.
+        Raises KeyError if the item is not in the collection.
+        """
+        item = self.get_item(item_id)
+        if item is None:
+            raise KeyError(item_id)
+
+        # Leave out the item itself and, when collapsing, its near-duplicates.
+        # The group is named after one of its items, which is a valid result
+        # when duplicates are shown.
+        exclude_ids = {item_id}
+        if collapse_duplicates:
+            exclude_ids.add(item["metadata"].get("dup_group", item_id))
+        return self.search_vectors(
+            item["embedding"][None, :],
+            top_k,
+            collapse_duplicates,
+            exclude_ids=exclude_ids,
+        )[0]
+
+    def search_by_image(
+        self, image: Image.Image, top_k: int = 5, collapse_duplicates: bool = True
+    ) -> List[Dict[str, Any]]:
+        """Search for items similar to an image, embedded with the vision tower"""
+        if self.model is None or self.serving_collection is None:
+            raise RuntimeError("Model and database must be initialized first")
+
+        try:
+            query_vectors = self.encode_image([image])
+            return self.search_vectors(query_vectors, top_k, collapse_duplicates)[0]
+        except Exception as e:
+            logger.error("Image search error: %s", e)
+            raise
+
+    @staticmethod
+    def _format_results(
+        results: Dict[str, Any],
+        top_k: int,
+        collapse_duplicates: bool,
+        exclude_ids: Iterable[str] = (),
+    ) -> List[Dict[str, Any]]:
+        """
+        Turn a single-query ChromaDB result into API dicts, best first.
+        Items in `exclude_ids` are skipped, as are their groups when collapsing.
+        The dicts have the fields of the API's SearchResult, in order, and are
+        serialized as they are.
+        """
+        search_results = []
+        exclude_ids = set(exclude_ids)
+        seen_groups = set(exclude_ids) if collapse_duplicates else set()
+        if results["ids"] and len(results["ids"][0]) > 0:
+            for item_id, distance, metadata in zip(
+                results["ids"][0], results["distances"][0], results["metadatas"][0]
+            ):
+                if item_id in exclude_ids:
+                    continue
+                metadata = metadata or {}
+                if collapse_duplicates:
+                    group = metadata.get("dup_group", item_id)
+                    if group in seen_groups:
+                        continue
+                    seen_groups.add(group)
+
+                similarity = 1 - distance if distance <= 1 else 0
+                search_results.append(
+                    {
+                        "id": item_id,
+                        "title": metadata.get("title", ""),
+                        "price": _price(metadata.get("price")),
+                        "currency": metadata.get("currency", "EUR"),
+                        "url": metadata.get("url", ""),
+                        "image_url": metadata.get("image_url", ""),
+                        "similarity": round(similarity, 3),
+                        "catalog": None,
+                    }
+                )
+                if len(search_results) >= top_k:
+                    break
+
+        return search_results
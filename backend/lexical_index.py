@@ -0,0 +1,417 @@
+"""
+BM25 inverted index over item titles, brands and descriptions, for the
+hybrid search mode.
+
+The index is a list of immutable segments, each a directory of .npy
+postings that are memory-mapped when loaded. The refresh job keeps it in
+sync with the collection: new items, and items whose indexed text changed,
+become a new segment (a document in a newer segment shadows its older
+versions), removed items become tombstones, and segments are merged once
+there are too many of them or too many dead rows. A manifest names the
+live segments; the API picks up a new one when it changes.
+"""
+
+import os
+import re
+import json
+import zlib
+import shutil
+import logging
+import unicodedata
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import numpy
+
+from config import get_config
+
+config = get_config()
+
+logger = logging.getLogger(__name__)
+
+# Metadata fields indexed for lexical search
+LEXICAL_FIELDS = ("title", "brand", "description")
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_DELETED_FRACTION = 0.2  # Merge segments once this share is tombstoned
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, accent-free word tokens of at least two characters"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [token for token in re.findall(r"\w+", text) if len(token) > 1]
+
+
+def document_text(metadata: Optional[Dict[str, Any]]) -> str:
+    """Indexed text of an item, from its ChromaDB metadata"""
+    metadata = metadata or {}
+    return " ".join(str(metadata.get(field) or "") for field in LEXICAL_FIELDS)
+
+
+def text_hash(text: str) -> int:
+    """Checksum of an indexed text, to notice when an item changes"""
+    return zlib.crc32(text.encode("utf-8"))
+
+
+class Segment:
+    """
+    Postings of a batch of documents: for each term, a slice of `docs`
+    (segment rows) and `tfs` (term frequencies), located through `vocab`.
+    `hashes` are the text_hash of each document (-1 if unknown).
+    """
+
+    def __init__(
+        self,
+        ids: List[str],
+        vocab: Dict[str, List[int]],
+        docs: numpy.ndarray,
+        tfs: numpy.ndarray,
+        lengths: numpy.ndarray,
+        hashes: Optional[numpy.ndarray] = None,
+    ):
+        self.ids = ids
+        self.vocab = vocab
+        self.docs = docs
+        self.tfs = tfs
+        self.lengths = lengths
+        if hashes is None:
+            hashes = numpy.full(len(ids), -1, dtype=numpy.int64)
+        self.hashes = hashes
+        self.alive = numpy.ones(len(ids), dtype=bool)
+
+    @classmethod
+    def from_texts(cls, ids: List[str], texts: Iterable[str]) -> "Segment":
+        postings: Dict[str, List[List[int]]] = defaultdict(lambda: [[], []])
+        lengths = numpy.zeros(len(ids), dtype=numpy.uint16)
+        hashes = numpy.zeros(len(ids), dtype=numpy.int64)
+        for row, text in enumerate(texts):
+            hashes[row] = text_hash(text)
+            counts = Counter(tokenize(text))
+            lengths[row] = min(sum(counts.values()), 65535)
+            for term, tf in counts.items():
+                postings[term][0].append(row)
+                postings[term][1].append(min(tf, 65535))
+        return cls._from_postings(ids, postings, lengths, hashes)
+
+    @classmethod
+    def _from_postings(
+        cls,
+        ids: List[str],
+        postings: Dict[str, List[Any]],
+        lengths: numpy.ndarray,
+        hashes: numpy.ndarray,
+    ) -> "Segment":
+        vocab: Dict[str, List[int]] = {}
+        docs, tfs = [], []
+        start = 0
+        for term in sorted(postings):
+            term_docs, term_tfs = postings[term]
+            vocab[term] = [start, len(term_docs)]
+            docs.append(numpy.asarray(term_docs, dtype=numpy.int32))
+            tfs.append(numpy.asarray(term_tfs, dtype=numpy.uint16))
+            start += len(term_docs)
+        return cls(
+            ids,
+            vocab,
+            numpy.concatenate(docs) if docs else numpy.zeros(0, numpy.int32),
+            numpy.concatenate(tfs) if tfs else numpy.zeros(0, numpy.uint16),
+            lengths,
+            hashes,
+        )
+
+    @classmethod
+    def merge(cls, segments: List["Segment"]) -> "Segment":
+        """One segment with the live documents of `segments`"""
+        ids: List[str] = []
+        lengths, hashes, row_maps = [], [], []
+        for segment in segments:
+            row_map = numpy.full(len(segment.ids), -1, dtype=numpy.int64)
+            live_rows = numpy.flatnonzero(segment.alive)
+            row_map[live_rows] = numpy.arange(len(ids), len(ids) + len(live_rows))
+            row_maps.append(row_map)
+            ids.extend(segment.ids[row] for row in live_rows)
+            lengths.append(numpy.asarray(segment.lengths)[live_rows])
+            hashes.append(numpy.asarray(segment.hashes)[live_rows])
+
+        postings: Dict[str, List[Any]] = {}
+        terms = sorted(set().union(*(segment.vocab for segment in segments)))
+        for term in terms:
+            term_docs, term_tfs = [], []
+            for segment, row_map in zip(segments, row_maps):
+                if term not in segment.vocab:
+                    continue
+                start, count = segment.vocab[term]
+                rows = row_map[segment.docs[start : start + count]]
+                keep = rows >= 0
+                term_docs.append(rows[keep])
+                term_tfs.append(segment.tfs[start : start + count][keep])
+            if term_docs and sum(len(d) for d in term_docs):
+                postings[term] = [
+                    numpy.concatenate(term_docs),
+                    numpy.concatenate(term_tfs),
+                ]
+        return cls._from_postings(
+            ids,
+            postings,
+            numpy.concatenate(lengths).astype(numpy.uint16),
+            numpy.concatenate(hashes).astype(numpy.int64),
+        )
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        numpy.save(os.path.join(path, "docs.npy"), self.docs)
+        numpy.save(os.path.join(path, "tfs.npy"), self.tfs)
+        numpy.save(os.path.join(path, "lengths.npy"), self.lengths)
+        numpy.save(os.path.join(path, "hashes.npy"), self.hashes)
+        with open(os.path.join(path, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(self.vocab, f, ensure_ascii=False)
+        with open(os.path.join(path, "ids.json"), "w", encoding="utf-8") as f:
+            json.dump(self.ids, f)
+
+    @classmethod
+    def load(cls, path: str) -> "Segment":
+        with open(os.path.join(path, "vocab.json"), "r", encoding="utf-8") as f:
+            vocab = json.load(f)
+        with open(os.path.join(path, "ids.json"), "r", encoding="utf-8") as f:
+            ids = json.load(f)
+        # Segments saved before hashes were kept are re-indexed on next sync
+        hashes_path = os.path.join(path, "hashes.npy")
+        hashes = numpy.load(hashes_path) if os.path.exists(hashes_path) else None
+        return cls(
+            ids,
+            vocab,
+            numpy.load(os.path.join(path, "docs.npy"), mmap_mode="r"),
+            numpy.load(os.path.join(path, "tfs.npy"), mmap_mode="r"),
+            numpy.load(os.path.join(path, "lengths.npy"), mmap_mode="r"),
+            hashes,
+        )
+
+
+class LexicalIndex:
+    """Segmented BM25 index kept in sync with a ChromaDB collection"""
+
+    def __init__(
+        self,
+        path: str = config["lexical_index_path"],
+        max_segments: int = config["lexical_max_segments"],
+    ):
+        self.path = path
+        self.max_segments = max_segments
+        self.segment_names: List[str] = []
+        self.segments: List[Segment] = []
+        self.deleted: Set[str] = set()
+        self.document_count = 0
+        self.average_length = 1.0
+        self.document_frequency: Counter = Counter()
+        self._manifest_mtime: Optional[float] = None
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.path, "manifest.json")
+
+    def load(self) -> bool:
+        """Open the segments named by the manifest; False if none is built"""
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return False
+        segments = [
+            Segment.load(os.path.join(self.path, name))
+            for name in manifest["segments"]
+        ]
+        self.segment_names = manifest["segments"]
+        self.segments = segments
+        self.deleted = set(manifest["deleted"])
+        self._refresh_statistics()
+        self._manifest_mtime = os.stat(self.manifest_path).st_mtime
+        logger.info(
+            "Loaded lexical index: %d documents in %d segments",
+            self.document_count,
+            len(self.segments),
+        )
+        return True
+
+    def reload_if_changed(self) -> None:
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime
+        except OSError:
+            return
+        if mtime == self._manifest_mtime:
+            return
+        try:
+            self.load()
+        except Exception as e:
+            logger.warning("Could not load lexical index: %s", e)
+
+    def _refresh_statistics(self) -> None:
+        """Live masks, corpus size, average length and live document frequencies"""
+        # A row is dead if tombstoned, or shadowed by a newer segment
+        dead: Set[str] = set(self.deleted)
+        for segment in reversed(self.segments):
+            segment.alive = numpy.fromiter(
+                (item_id not in dead for item_id in segment.ids),
+                dtype=bool,
+                count=len(segment.ids),
+            )
+            dead.update(segment.ids)
+
+        total_length = 0
+        self.document_count = 0
+        self.document_frequency = Counter()
+        for segment in self.segments:
+            self.document_count += int(segment.alive.sum())
+            total_length += int(numpy.asarray(segment.lengths)[segment.alive].sum())
+            if segment.alive.all():
+                for term, (_, count) in segment.vocab.items():
+                    self.document_frequency[term] += count
+                continue
+            # Only live rows count, or df can exceed the number of documents
+            live = numpy.concatenate(
+                ([0], numpy.cumsum(segment.alive[numpy.asarray(segment.docs)]))
+            )
+            for term, (start, count) in segment.vocab.items():
+                frequency = int(live[start + count] - live[start])
+                if frequency:
+                    self.document_frequency[term] += frequency
+        self.average_length = total_length / max(self.document_count, 1)
+
+    def indexed_ids(self) -> Set[str]:
+        """IDs of live documents"""
+        return set(self.indexed_hashes())
+
+    def indexed_hashes(self) -> Dict[str, int]:
+        """Text hash of each live document"""
+        hashes: Dict[str, int] = {}
+        for segment in self.segments:
+            for row in numpy.flatnonzero(segment.alive):
+                hashes[segment.ids[row]] = int(segment.hashes[row])
+        return hashes
+
+    def sync(self, collection, page_size: int) -> Dict[str, Any]:
+        """
+        Index items added to `collection` since the last sync, re-index the
+        ones whose indexed text changed and tombstone the ones removed from
+        it, then write a new manifest.
+        """
+        indexed = self.indexed_hashes()
+        current: Set[str] = set()
+        new_ids: List[str] = []
+        new_texts: List[str] = []
+        updated = 0
+        for offset in range(0, collection.count(), page_size):
+            page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            for item_id, metadata in zip(page["ids"], page["metadatas"]):
+                current.add(item_id)
+                text = document_text(metadata)
+                if indexed.get(item_id) != text_hash(text):
+                    updated += item_id in indexed
+                    new_ids.append(item_id)
+                    new_texts.append(text)
+
+        removed = set(indexed) - current
+        self.deleted |= removed
+        # Re-added items come back to life; their new row shadows the old ones
+        self.deleted -= set(new_ids)
+        if new_ids:
+            self.segments.append(Segment.from_texts(new_ids, new_texts))
+            self.segment_names.append(self._save_segment(self.segments[-1]))
+        self._refresh_statistics()
+
+        merged = False
+        total = sum(len(segment.ids) for segment in self.segments)
+        if len(self.segments) > self.max_segments or (
+            total and (total - self.document_count) / total > MAX_DELETED_FRACTION
+        ):
+            self.segments = [Segment.merge(self.segments)]
+            self.segment_names = [self._save_segment(self.segments[0])]
+            self.deleted = set()
+            self._refresh_statistics()
+            merged = True
+
+        self._write_manifest()
+        report = {
+            "documents": self.document_count,
+            "segments": len(self.segments),
+            "added": len(new_ids) - updated,
+            "updated": updated,
+            "removed": len(removed),
+            "merged": merged,
+        }
+        logger.info(
+            "Lexical index synced: %d added, %d updated, %d removed, "
+            "%d documents in %d segments",
+            len(new_ids) - updated,
+            updated,
+            len(removed),
+            self.document_count,
+            len(self.segments),
+        )
+        return report
+
+    def _save_segment(self, segment: Segment) -> str:
+        name = f"segment_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+        segment.save(os.path.join(self.path, name))
+        return name
+
+    def _write_manifest(self) -> None:
+        """Swap in the new manifest, then delete segments it no longer names"""
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "segments": self.segment_names,
+                    "deleted": sorted(self.deleted),
+                    "updated_at": datetime.now().isoformat(),
+                },
+                f,
+            )
+        os.replace(tmp_path, self.manifest_path)
+        self._manifest_mtime = os.stat(self.manifest_path).st_mtime
+
+        for entry in os.listdir(self.path):
+            entry_path = os.path.join(self.path, entry)
+            if os.path.isdir(entry_path) and entry not in self.segment_names:
+                shutil.rmtree(entry_path, ignore_errors=True)
+
+    def search(self, query: str, top_k: int) -> List[str]:
+        """IDs of the `top_k` best BM25 matches for `query`, best first"""
+        terms = set(tokenize(query))
+        hit_ids: List[str] = []
+        hit_scores: List[numpy.ndarray] = []
+        for segment in self.segments:
+            rows, scores = [], []
+            for term in terms:
+                if term not in segment.vocab:
+                    continue
+                start, count = segment.vocab[term]
+                term_rows = numpy.asarray(segment.docs[start : start + count])
+                tf = segment.tfs[start : start + count].astype(numpy.float32)
+                norm = 1 - BM25_B + BM25_B * (
+                    segment.lengths[term_rows] / self.average_length
+                )
+                df = self.document_frequency[term]
+                idf = numpy.log1p((self.document_count - df + 0.5) / (df + 0.5))
+                rows.append(term_rows)
+                scores.append(idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm))
+            if not rows:
+                continue
+
+            rows_array = numpy.concatenate(rows)
+            unique_rows, inverse = numpy.unique(rows_array, return_inverse=True)
+            totals = numpy.bincount(inverse, weights=numpy.concatenate(scores))
+            live = segment.alive[unique_rows]
+            unique_rows, totals = unique_rows[live], totals[live]
+            if len(totals) > top_k:
+                best = numpy.argpartition(-totals, top_k)[:top_k]
+                unique_rows, totals = unique_rows[best], totals[best]
+            hit_ids.extend(segment.ids[row] for row in unique_rows)
+            hit_scores.append(totals)
+
+        if not hit_ids:
+            return []
+        order = numpy.argsort(-numpy.concatenate(hit_scores), kind="stable")
+        return [hit_ids[i] for i in order[:top_k]]
@@ -0,0 +1,119 @@
+"""
+Shared logging setup for the API, the refresh job and the scraper CLI.
+
+Records are handed to a queue and formatted and written by a background
+listener thread, so request handlers never block on stdout or the log file.
+"""
+
+import sys
+import atexit
+import queue
+import random
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, TextIO
+
+from config import get_config
+
+config = get_config()
+
+_listener: Optional[QueueListener] = None
+_sample_rate: float = config["log_sample_rate"]
+
+
+# Arguments that cannot change after the log call, so formatting can wait
+_IMMUTABLE_ARG_TYPES = (str, int, float, bool, bytes, type(None))
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves message formatting to the listener thread.
+    Records whose arguments could be mutated after the call are formatted
+    eagerly, like the stock handler does for all records.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if isinstance(args, dict):
+            args = tuple(args.values())
+        if all(isinstance(arg, _IMMUTABLE_ARG_TYPES) for arg in args or ()):
+            return record
+        return super().prepare(record)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep each record with probability `rate`"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return self.rate >= 1.0 or random.random() < self.rate
+
+
+def setup_logging(
+    level: str = config["log_level"],
+    fmt: str = config["log_format"],
+    log_file: Optional[str] = None,
+    sample_rate: float = config["log_sample_rate"],
+    stream: Optional[TextIO] = None,
+) -> None:
+    """
+    Route all logging through a queue to stream (and optional file) handlers.
+    Per-request logs (see sample_request, uvicorn access) are sampled at
+    `sample_rate`. Calling it again replaces the previous setup.
+    """
+    global _listener, _sample_rate
+    _sample_rate = sample_rate
+    if _listener is not None:
+        _listener.stop()
+
+    formatter = logging.Formatter(fmt)
+    handlers = [logging.StreamHandler(stream or sys.stderr)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+
+    # uvicorn installs its own synchronous handlers; send its records here too
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+
+    access_logger = logging.getLogger("uvicorn.access")
+    access_logger.filters = [
+        f for f in access_logger.filters if not isinstance(f, SamplingFilter)
+    ]
+    access_logger.addFilter(SamplingFilter(sample_rate))
+
+
+def sample_request() -> bool:
+    """
+    Whether the current request should be logged, at LOG_SAMPLE_RATE.
+    Decided once per request, before any log call, so skipped requests
+    pay nothing for record creation.
+    """
+    return _sample_rate >= 1.0 or random.random() < _sample_rate
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
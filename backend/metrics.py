@@ -0,0 +1,84 @@
+"""
+Stage timing for search and ingest, exported as Prometheus histograms.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
+
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+SEARCH_STAGE_SECONDS = Histogram(
+    "vinted_search_stage_seconds",
+    "Time spent in each stage of a search request",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+INGEST_STAGE_SECONDS = Histogram(
+    "vinted_ingest_stage_seconds",
+    "Time spent in each stage of embedding ingest",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "vinted_http_request_seconds",
+    "End-to-end duration of API requests",
+    ["path"],
+    buckets=LATENCY_BUCKETS,
+)
+
+# Stage durations of the request being served, when timing headers are on
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+@contextmanager
+def timed(histogram: Histogram, stage: str) -> Iterator[None]:
+    """Observe the duration of the block under `stage`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.labels(stage=stage).observe(elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def start_request_timings() -> Dict[str, float]:
+    """Start collecting stage durations for the current request"""
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    """Format stage durations as a Server-Timing header value"""
+    return ", ".join(
+        f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings.items()
+    )
+
+
+def stage_totals(histogram: Histogram) -> Dict[str, Dict[str, float]]:
+    """Count and total seconds per stage observed so far in this process"""
+    totals: Dict[str, Dict[str, float]] = {}
+    for metric in histogram.collect():
+        for sample in metric.samples:
+            stage = sample.labels.get("stage")
+            if sample.name.endswith("_count"):
+                totals.setdefault(stage, {})["count"] = int(sample.value)
+            elif sample.name.endswith("_sum"):
+                totals.setdefault(stage, {})["seconds"] = round(sample.value, 3)
+    return totals
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Prometheus text exposition of all metrics, with its content type"""
+    return generate_latest(), CONTENT_TYPE_LATEST
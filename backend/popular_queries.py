@@ -0,0 +1,179 @@
+"""
+Query frequency log written by the API and the table of precomputed
+results for the most popular queries, written by the refresh job.
+"""
+
+import os
+import re
+import json
+import time
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows: flushes from several workers may race
+    fcntl = None
+
+from config import get_config
+
+config = get_config()
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Key under which equivalent queries are counted and cached"""
+    return re.sub(r"\s+", " ", query.strip().lower())
+
+
+def _write_json_atomic(path: str, data: Any) -> None:
+    """Write JSON to a temporary file, then swap it in"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class QueryLog:
+    """
+    Counts queries in memory and merges them into a JSON file on flush.
+    Persisted counts decay with a half-life of `half_life_days`, and only
+    the `max_queries` most frequent queries are kept. Flushes from several
+    API workers are serialized by a lock file next to the log.
+    """
+
+    def __init__(
+        self,
+        path: str = config["query_log_path"],
+        max_queries: int = config["query_log_max_queries"],
+        half_life_days: float = config["query_log_half_life_days"],
+    ):
+        self.path = path
+        self.max_queries = max_queries
+        self.half_life_days = half_life_days
+        self.pending: Counter = Counter()
+
+    def record(self, query: str) -> None:
+        self.pending[normalize_query(query)] += 1
+
+    def _load_table(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                table = json.load(f)
+        except (OSError, ValueError):
+            return {"updated_at": time.time(), "counts": {}}
+        if "counts" not in table:
+            # Plain counts written before decay was introduced
+            table = {"updated_at": time.time(), "counts": table}
+        return table
+
+    def load(self) -> Counter:
+        """Counts persisted so far, decayed to the time of the last flush"""
+        return Counter(self._load_table()["counts"])
+
+    def flush(self) -> None:
+        """Decay the persisted counts, add pending ones and keep the top"""
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, Counter()
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(f"{self.path}.lock", "w") as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                table = self._load_table()
+                now = time.time()
+                decay = 0.5 ** (
+                    max(now - table["updated_at"], 0.0)
+                    / (self.half_life_days * 86400)
+                )
+                counts = Counter(
+                    {query: count * decay for query, count in table["counts"].items()}
+                )
+                counts.update(pending)
+                _write_json_atomic(
+                    self.path,
+                    {
+                        "updated_at": now,
+                        "counts": dict(counts.most_common(self.max_queries)),
+                    },
+                )
+        except OSError as e:
+            logger.warning("Could not save query log: %s", e)
+
+    def top(self, n: int) -> List[str]:
+        """The `n` most frequent persisted queries"""
+        return [query for query, _ in self.load().most_common(n)]
+
+
+class PrecomputedResults:
+    """
+    Results of popular queries computed after a refresh. The API reloads
+    the table whenever the file changes on disk.
+
+    The table only holds vector-mode results: they are stored for
+    PRECOMPUTE_TOP_K and served to requests with a smaller top_k, which
+    hybrid results do not allow, as the candidates fused by RRF depend on
+    top_k.
+    """
+
+    def __init__(self, path: str = config["precomputed_results_path"]):
+        self.path = path
+        self.top_k = 0
+        self.collapse_duplicates = True
+        self.mode = "vector"
+        self.results: Dict[str, List[Dict[str, Any]]] = {}
+        self._mtime: Optional[float] = None
+
+    def save(
+        self,
+        results: Dict[str, List[Dict[str, Any]]],
+        top_k: int,
+        collapse_duplicates: bool,
+        mode: str = "vector",
+    ) -> None:
+        _write_json_atomic(
+            self.path,
+            {
+                "generated_at": datetime.now().isoformat(),
+                "top_k": top_k,
+                "collapse_duplicates": collapse_duplicates,
+                "mode": mode,
+                "results": results,
+            },
+        )
+
+    def reload_if_changed(self) -> None:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                table = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load precomputed results: %s", e)
+            return
+        self.top_k = table.get("top_k", 0)
+        self.collapse_duplicates = table.get("collapse_duplicates", True)
+        self.mode = table.get("mode", "vector")
+        self.results = table.get("results", {})
+        self._mtime = mtime
+        logger.info("Loaded precomputed results for %d queries", len(self.results))
+
+    def get(
+        self, query: str, top_k: int, collapse_duplicates: bool, mode: str = "vector"
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Stored results if they cover this request, otherwise None"""
+        if top_k > self.top_k or collapse_duplicates != self.collapse_duplicates:
+            return None
+        if mode != self.mode:
+            return None
+        results = self.results.get(normalize_query(query))
+        return None if results is None else results[:top_k]
@@ -5,6 +5,7 @@ Database refresh script for Vinted Fashion search assistant backend.
 
 import os
 import sys
+import json
 import logging
 import argparse
 import pandas as pd
@@ -16,21 +17,64 @@ backend_dir = Path(__file__).parent
 sys.path.insert(0, str(backend_dir))
 
 from scraper import VintedScraper  # noqa: E402
-from embeddings import ImageEmbedder  # noqa: E402
+from embeddings import ImageEmbedder, shard_collection_name  # noqa: E402
+from shards import ShardedIndex  # noqa: E402
+from config import get_config  # noqa: E402
+from metrics import INGEST_STAGE_SECONDS, stage_totals  # noqa: E402
+from logging_config import setup_logging  # noqa: E402
+from popular_queries import PrecomputedResults, QueryLog  # noqa: E402
+from compact_index import CompactIndex  # noqa: E402
+from lexical_index import LexicalIndex  # noqa: E402
 
+config = get_config()
 
-def setup_logging(log_file: str = None):
-    """Setup logging configuration"""
-    log_format = "[%(asctime)s] %(levelname)s: %(message)s"
 
-    if log_file:
-        logging.basicConfig(
-            level=logging.INFO,
-            format=log_format,
-            handlers=[logging.FileHandler(log_file), logging.StreamHandler()],
-        )
-    else:
-        logging.basicConfig(level=logging.INFO, format=log_format)
+def save_refresh_stats(
+    catalog: str, stats: dict, path: str = config["refresh_stats_path"]
+):
+    """Persist the last refresh counts of a catalog shard, served by /api/stats"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            all_stats = json.load(f)
+    except (OSError, ValueError):
+        all_stats = {}
+    if "completed_at" in all_stats:
+        all_stats = {}  # Single-collection format written before sharding
+    all_stats[catalog] = stats
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(all_stats, f, indent=2)
+
+
+def precompute_popular_queries(embedder: ImageEmbedder, top_n: int) -> int:
+    """
+    Search the `top_n` most frequent queries over all catalog shards, in
+    one batch, and store them
+    """
+    logger = logging.getLogger(__name__)
+    queries = QueryLog().top(top_n)
+    if not queries:
+        logger.info("No query log yet, skipping precomputation")
+        return 0
+
+    if embedder.model is None:
+        embedder.initialize_model()
+    index = ShardedIndex(chroma_path=embedder.chroma_path)
+    try:
+        index.initialize(encoder=embedder, serving=False)
+        top_k = config["precompute_top_k"]
+        # Vector mode only: a top-k slice of it matches a smaller live search
+        results = index.search_similar_batch(queries, top_k=top_k, mode="vector")
+    finally:
+        index.close()
+    PrecomputedResults().save(
+        dict(zip(queries, results)),
+        top_k=top_k,
+        collapse_duplicates=True,
+        mode="vector",
+    )
+    logger.info(f"Precomputed results for {len(queries)} popular queries")
+    return len(queries)
 
 
 def main():
@@ -51,19 +95,106 @@ def main():
         default=None, #"data/scrapped/scrapped_data.csv",
         help="Path to existing CSV data",
     )
+    parser.add_argument(
+        "--catalog",
+        choices=sorted(config["catalog_ids"]),
+        default=config["default_catalog"],
+        help="Catalog to scrape; its items go to their own index shard",
+    )
+    parser.add_argument(
+        "--record_path",
+        default=config["scrape_record_path"] or None,
+        help="Save the raw page responses of the crawl under this directory",
+    )
+    parser.add_argument(
+        "--replay_dir",
+        default=None,
+        help="Ingest a recorded crawl directory instead of scraping Vinted",
+    )
+    parser.add_argument(
+        "--write_chunk_size",
+        type=int,
+        default=config["write_chunk_size"],
+        help="Number of embeddings buffered per ChromaDB upsert",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        default=False,
+        help="Ignore the ingest checkpoint left by an interrupted run",
+    )
+    parser.add_argument(
+        "--stale_after_days",
+        type=float,
+        default=config["stale_after_days"],
+        help="Evict items the scraper has not seen for this many days",
+    )
+    parser.add_argument(
+        "--evict",
+        action="store_true",
+        default=False,
+        help=(
+            "Evict stale items after ingest; only safe when the crawl covers "
+            "the whole catalog, as items beyond MAX_PAGES are never seen"
+        ),
+    )
+    parser.add_argument(
+        "--precompute_top_n",
+        type=int,
+        default=config["precompute_top_n"],
+        help="Precompute results for this many popular queries (0 disables)",
+    )
+    parser.add_argument(
+        "--rebuild_index",
+        action="store_true",
+        default=False,
+        help="Rebuild the collection after --evict to compact the index",
+    )
+    parser.add_argument(
+        "--compact_dim",
+        type=int,
+        default=config["compact_dim"],
+        help="Build a PCA-reduced search index of this dimension (0 disables)",
+    )
+    parser.add_argument(
+        "--compact_dtype",
+        choices=["float16", "int8"],
+        default=config["compact_dtype"],
+        help="Quantization of the full vectors used to re-rank compact results",
+    )
+    parser.add_argument(
+        "--skip_lexical_index",
+        action="store_true",
+        default=False,
+        help="Do not update the BM25 index used by hybrid search",
+    )
 
     args = parser.parse_args()
 
     # Setup logging
     os.makedirs(os.path.dirname(args.log_file), exist_ok=True)
-    setup_logging(args.log_file)
+    setup_logging(
+        fmt="[%(asctime)s] %(levelname)s: %(message)s", log_file=args.log_file
+    )
     logger = logging.getLogger(__name__)
 
     try:
         # Initialize scraper
-        scraper = VintedScraper()
-        # Initialize embedder
-        embedder = ImageEmbedder()
+        scraper = VintedScraper(
+            catalog_id=config["catalog_ids"][args.catalog],
+            record_path=args.record_path,
+            replay_dir=args.replay_dir,
+        )
+        # Initialize embedder on the catalog's shard, with its own checkpoint
+        checkpoint_root, checkpoint_ext = os.path.splitext(config["checkpoint_path"])
+        embedder = ImageEmbedder(
+            write_chunk_size=args.write_chunk_size,
+            checkpoint_path=f"{checkpoint_root}_{args.catalog}{checkpoint_ext}",
+            collection_name=shard_collection_name(args.catalog),
+        )
+        if args.restart:
+            embedder.clear_checkpoint()
+            logger.info("Discarded previous ingest checkpoint")
 
         # Get initial count
         embedder.initialize_database()
@@ -107,8 +238,7 @@ def main():
             )
 
             # Extract minimal fields
-            minimal_items = scraper.extract_minimal_item_fields(raw_items)
-            items_df = pd.DataFrame(minimal_items)
+            items_df = scraper.extract_minimal_item_fields(raw_items)
 
             # Save data locally if requested
             if args.save_data:
@@ -121,10 +251,84 @@ def main():
             total_added += added
             logger.info(f"Added {added} items from catalog {scraper.catalog_id}")
 
+        # Compaction: drop listings that are no longer on Vinted
+        evicted = 0
+        if args.evict:
+            evicted = embedder.evict_stale_items(args.stale_after_days)
+            if args.rebuild_index and evicted:
+                embedder.rebuild_collection()
+        # Collections replaced by earlier rebuilds, once no API serves them
+        embedder.retire_superseded_collections()
+
+        # Lexical index: BM25 over titles, brands and descriptions
+        lexical_report = None
+        if not args.skip_lexical_index:
+            lexical_index = LexicalIndex(
+                path=embedder.shard_path(config["lexical_index_path"])
+            )
+            lexical_index.load()
+            lexical_report = lexical_index.sync(
+                embedder.collection, embedder.client.get_max_batch_size()
+            )
+            embedder.load_lexical_index(lexical_index)
+
+        # Compact index: reduced vectors for ANN, quantized ones to re-rank
+        compact_report = None
+        if args.compact_dim > 0:
+            index = CompactIndex(
+                path=embedder.shard_path(config["compact_index_path"]),
+                dim=args.compact_dim,
+                dtype=args.compact_dtype,
+            )
+            if embedder.collection.count() == 0:
+                # Nothing to build from, e.g. every item was evicted: the
+                # previous version (if any) is kept until the next build
+                logger.warning(
+                    "Collection is empty, keeping the previous compact index"
+                )
+                index.retire_superseded_versions(
+                    embedder.client, embedder.collection_name
+                )
+                compact_report = {"skipped": "empty collection"}
+            else:
+                compact_report = index.build(
+                    embedder.client, embedder.collection, embedder.collection_name
+                )
+                embedder.load_compact_index(index)
+
+        # Warm table: results for the most frequent API queries
+        precomputed = 0
+        if args.precompute_top_n > 0:
+            precomputed = precompute_popular_queries(embedder, args.precompute_top_n)
+
         # Get final count
         final_count = embedder.collection.count()
         logger.info(f"Final database count: {final_count}")
         logger.info(f"Total new items added: {total_added}")
+        logger.info(f"Total stale items evicted: {evicted}")
+        ingest_stages = stage_totals(INGEST_STAGE_SECONDS)
+        for stage, totals in ingest_stages.items():
+            logger.info(
+                f"Ingest stage {stage}: {totals.get('seconds', 0)}s "
+                f"over {totals.get('count', 0)} calls"
+            )
+
+        save_refresh_stats(
+            args.catalog,
+            {
+                "initial_count": initial_count,
+                "final_count": final_count,
+                "added": total_added,
+                "evicted": evicted,
+                "precomputed_queries": precomputed,
+                "compact_index": compact_report,
+                "lexical_index": lexical_report,
+                "stale_after_days": args.stale_after_days,
+                "ingest_stages": ingest_stages,
+                "cpu_budget": embedder.cpu_budget,
+                "completed_at": datetime.now().isoformat(),
+            }
+        )
 
         # Log success
         logger.info("Database refresh completed successfully")
@@ -17,12 +17,28 @@ import cloudscraper
 from typing import List, Union, Optional, Dict, Any, Iterable
 
 from config import get_config
+from logging_config import setup_logging
 
 config = get_config()
 
-logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
 
+# Output column -> (item key, nested key) for extract_minimal_item_fields
+MINIMAL_ITEM_FIELDS = {
+    "ID": ("id", None),
+    "TITLE": ("title", None),
+    "PATH": ("path", None),
+    "USER_ID": ("user", "id"),
+    "URL": ("url", None),
+    "PHOTO_URL": ("photo", "url"),
+    "SIZE": ("size_title", None),
+    "TOTAL_ITEM_PRICE_AMOUNT": ("total_item_price", "amount"),
+    "TOTAL_ITEM_PRICE_CURRENCY": ("total_item_price", "currency_code"),
+    "STATUS": ("status", None),
+    "BRAND": ("item_box", "first_line"),
+    "DESCRIPTION": ("item_box", "accessibility_label"),
+}
+
 
 class VintedScraper:
     """Main scraper class for Vinted items and embeddings"""
@@ -35,6 +51,8 @@ class VintedScraper:
         catalog_id: int = config["catalog_ids"]["dresses"],
         max_pages: int = config["max_pages"],
         per_page: int = config["items_per_page"],
+        record_path: Optional[str] = config["scrape_record_path"] or None,
+        replay_dir: Optional[str] = None,
     ):
         self.local_save_path = local_save_path
         self.vinted_link = vinted_link
@@ -42,6 +60,10 @@ class VintedScraper:
         self.catalog_id = catalog_id
         self.max_pages = max_pages
         self.per_page = per_page
+        # Crawls are recorded under record_path, one directory each
+        self.record_path = record_path
+        self.replay_dir = replay_dir
+        self.record_dir: Optional[str] = None
 
     def create_public_session_fr(self) -> requests.Session:
         """Create a public session for the Vinted website"""
@@ -126,9 +148,20 @@ class VintedScraper:
 
         Returns:
             List of raw item JSON dictionaries.
+
+        With `record_path` set, every page response is saved in a new crawl
+        directory under it; with `replay_dir` set, the pages recorded there
+        are returned instead of querying Vinted.
         """
+        if self.replay_dir:
+            return self.replay_recorded_items(self.replay_dir, verbose)
 
         session = self.create_public_session_fr()
+        if self.record_path:
+            self.record_dir = os.path.join(
+                self.record_path,
+                f"catalog{self.catalog_id}-{time.strftime('%Y%m%d-%H%M%S')}",
+            )
 
         def norm_list(val):
             if val is None:
@@ -214,6 +247,8 @@ class VintedScraper:
                         time.sleep(2 * attempt)
                         continue
 
+                    if self.record_dir:
+                        self.record_page(page, params, data)
                     items = data.get("items", [])
                     if verbose:
                         logging.info(
@@ -258,6 +293,53 @@ class VintedScraper:
 
         return collected
 
+    def record_page(
+        self, page: int, params: Dict[str, Any], data: Dict[str, Any]
+    ) -> None:
+        """Save one raw page response of the current crawl"""
+        os.makedirs(self.record_dir, exist_ok=True)
+        path = os.path.join(self.record_dir, f"page-{page:04d}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "page": page,
+                    "params": params,
+                    "recorded_at": int(time.time()),
+                    "response": data,
+                },
+                f,
+                ensure_ascii=False,
+            )
+
+    @staticmethod
+    def load_recorded_pages(record_dir: str) -> List[Dict[str, Any]]:
+        """Pages saved by record_page, in crawl order"""
+        names = sorted(
+            name
+            for name in os.listdir(record_dir)
+            if name.startswith("page-") and name.endswith(".json")
+        )
+        pages = []
+        for name in names:
+            with open(os.path.join(record_dir, name), "r", encoding="utf-8") as f:
+                pages.append(json.load(f))
+        return pages
+
+    def replay_recorded_items(
+        self, record_dir: str, verbose: bool = True
+    ) -> List[Dict[str, Any]]:
+        """Raw items of a recorded crawl, as fetch_vinted_items_fr returned them"""
+        collected: List[Dict[str, Any]] = []
+        for page in self.load_recorded_pages(record_dir):
+            items = page["response"].get("items", [])
+            if verbose:
+                logging.info(
+                    f"Replayed page {page['page']}: {len(items)} items "
+                    f"(total so far {len(collected)})"
+                )
+            collected.extend(items)
+        return collected
+
     def save_scrapped_data(self, data: pd.DataFrame) -> None:
         """Save scrapped data to a CSV file"""
         try:
@@ -272,8 +354,11 @@ class VintedScraper:
     @staticmethod
     def extract_minimal_item_fields(
         items: Iterable[Dict[str, Any]],
-    ) -> List[Dict[str, Any]]:
-        """Return a list of dicts containing only the requested fields for each item.
+        seen_at: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """Return a DataFrame containing only the requested fields for each item.
+        Columns are built one field at a time (see MINIMAL_ITEM_FIELDS) instead
+        of assembling an intermediate dict per item.
         Fields kept:
         - id
         - title
@@ -288,34 +373,27 @@ class VintedScraper:
         - item_box_first_line
         - item_box_second_line
         - item_box_accessibility_label
+        - last_seen (scrape time as a unix timestamp, `seen_at` or now)
         """
-        minimal: List[Dict[str, Any]] = []
-        for it in items:
-            user = it.get("user") or {}
-            photo = it.get("photo") or {}
-            tip = it.get("total_item_price") or {}
-            box = it.get("item_box") or {}
-            minimal.append(
-                {
-                    "ID": it.get("id"),
-                    "TITLE": it.get("title"),
-                    "PATH": it.get("path"),
-                    "USER_ID": user.get("id"),
-                    "URL": it.get("url"),
-                    "PHOTO_URL": photo.get("url"),
-                    "SIZE": it.get("size_title"),
-                    "TOTAL_ITEM_PRICE_AMOUNT": tip.get("amount"),
-                    "TOTAL_ITEM_PRICE_CURRENCY": tip.get("currency_code"),
-                    "STATUS": it.get("status"),
-                    "BRAND": box.get("first_line"),
-                    "DESCRIPTION": box.get("accessibility_label"),
-                }
-            )
-        return minimal
+        items = items if isinstance(items, list) else list(items)
+        columns: Dict[str, List[Any]] = {}
+        parents: Dict[str, List[Dict[str, Any]]] = {}
+        for column, (key, sub_key) in MINIMAL_ITEM_FIELDS.items():
+            if sub_key is None:
+                columns[column] = [it.get(key) for it in items]
+                continue
+            # Resolve each nested object once and share it between its fields
+            if key not in parents:
+                parents[key] = [it.get(key) or {} for it in items]
+            columns[column] = [obj.get(sub_key) for obj in parents[key]]
+        items_df = pd.DataFrame(columns, columns=list(MINIMAL_ITEM_FIELDS))
+        items_df["LAST_SEEN"] = int(time.time()) if seen_at is None else seen_at
+        return items_df
 
 
 def main():
     """CLI interface for the scraper"""
+    setup_logging()
     parser = argparse.ArgumentParser(description="Vinted Fashion Scraper")
     parser.add_argument(
         "--save_data_locally",
@@ -328,13 +406,23 @@ def main():
         default="data/scrapped/scrapped_data.csv",
         help="Load existing data from CSV instead of scraping",
     )
+    parser.add_argument(
+        "--record_path",
+        default=config["scrape_record_path"] or None,
+        help="Save the raw page responses of the crawl under this directory",
+    )
+    parser.add_argument(
+        "--replay_dir",
+        default=None,
+        help="Replay a recorded crawl directory instead of querying Vinted",
+    )
 
     args = parser.parse_args()
 
     # Initialize scraper
-    scrapper = VintedScraper()
+    scrapper = VintedScraper(record_path=args.record_path, replay_dir=args.replay_dir)
 
-    if args.load_data_path:
+    if args.load_data_path and not args.replay_dir:
         # Load existing data from CSV instead of Scrapping - for tests purposes
         logger.info(f"Loading existing data from {args.load_data_path}...")
         try:
@@ -358,8 +446,7 @@ def main():
         logger.info(f"Scraped {len(raw_items)} raw items")
 
         # Extract minimal fields
-        minimal_items = scrapper.extract_minimal_item_fields(raw_items)
-        items_df = pd.DataFrame(minimal_items)
+        items_df = scrapper.extract_minimal_item_fields(raw_items)
 
         if args.save_data_locally:
             logger.info("Saving items locally...")
@@ -0,0 +1,320 @@
+"""
+Index sharded by catalog: one ChromaDB collection per entry of CATALOG_IDS,
+each refreshed on its own. Searches encode the query once, query the
+targeted shards concurrently and merge their top-k.
+"""
+
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy
+from PIL import Image
+
+from config import get_config
+from embeddings import ImageEmbedder, shard_collection_name
+from metrics import SEARCH_STAGE_SECONDS, timed
+from versions import ServingRegistry
+
+config = get_config()
+
+logger = logging.getLogger(__name__)
+
+
+class ShardedIndex:
+    """Catalog shards sharing one CLIP model, searched in parallel"""
+
+    def __init__(
+        self,
+        catalogs: Optional[List[str]] = None,
+        model_path: str = config["model_path"],
+        chroma_path: str = config["chroma_db_path"],
+        max_workers: int = config["search_max_workers"],
+    ):
+        self.catalogs = list(catalogs or config["search_catalogs"])
+        unknown = set(self.catalogs) - set(config["catalog_ids"])
+        if unknown:
+            raise ValueError(f"Unknown catalogs: {sorted(unknown)}")
+        self.model_path = model_path
+        self.chroma_path = chroma_path
+        self.encoder: Optional[ImageEmbedder] = None
+        self.shards: Dict[str, ImageEmbedder] = {}
+        self.sizes: Dict[str, int] = {}
+        self.registry = ServingRegistry()
+        self.serving = False
+        self.pool = ThreadPoolExecutor(
+            max_workers=max(1, min(max_workers, len(self.catalogs))),
+            thread_name_prefix="shard-search",
+        )
+
+    @property
+    def model(self):
+        return self.encoder.model if self.encoder is not None else None
+
+    def initialize(
+        self,
+        encoder: Optional[ImageEmbedder] = None,
+        load_model: bool = True,
+        serving: bool = True,
+    ) -> None:
+        """
+        Open one collection per catalog: its compact index when one is built
+        and COMPACT_DIM is set, else the full collection. The CLIP model is
+        loaded once (or taken from `encoder`) and shared by all shards.
+        With `serving` off (offline use, e.g. from a refresh job), catalogs
+        without a collection are skipped rather than created, and the
+        process is not recorded in the serving registry.
+        """
+        self.serving = serving
+        self.encoder = encoder or ImageEmbedder(
+            model_path=self.model_path, chroma_path=self.chroma_path
+        )
+        if load_model and self.encoder.model is None:
+            self.encoder.initialize_model(role="search")
+
+        for catalog in self.catalogs:
+            shard = ImageEmbedder(
+                model_path=self.model_path,
+                chroma_path=self.chroma_path,
+                collection_name=shard_collection_name(catalog),
+            )
+            shard.model = self.encoder.model
+            shard.processor = getattr(self.encoder, "processor", None)
+            shard.initialize_database(open_collection=False)
+            if config["compact_dim"] <= 0 or not shard.load_compact_index():
+                if not shard.open_collection(create=serving):
+                    continue
+            shard.load_lexical_index()
+            self.shards[catalog] = shard
+        self.acknowledge()
+        self.sizes = self.counts()
+        logger.info(
+            "Opened %d shards with %d items", len(self.shards), self.count()
+        )
+
+    def count(self) -> int:
+        return sum(self.counts().values())
+
+    def counts(self) -> Dict[str, int]:
+        """Items per catalog shard"""
+        return {
+            catalog: shard.serving_collection.count()
+            for catalog, shard in self.shards.items()
+        }
+
+    def serving_versions(self) -> List[str]:
+        """Collections searched by this process, kept by refresh jobs"""
+        return [
+            collection.name
+            for shard in self.shards.values()
+            for collection in (shard.collection, shard.serving_collection)
+            if collection is not None
+        ]
+
+    def acknowledge(self) -> None:
+        """Tell refresh jobs which collections this process still serves"""
+        if not self.serving:
+            return
+        try:
+            self.registry.acknowledge(self.serving_versions())
+        except OSError as e:
+            logger.warning("Could not record served collections: %s", e)
+
+    def close(self) -> None:
+        """Stop the search threads and leave the serving registry"""
+        self.pool.shutdown()
+        if self.serving:
+            self.registry.release()
+
+    def reload_side_indexes(self) -> None:
+        """
+        Pick up rebuilt collections, shard sizes and side indexes updated
+        by refresh jobs. Run at least every SERVING_ACK_TTL seconds, so
+        refresh jobs keep the versions this process serves.
+        """
+        try:
+            for shard in self.shards.values():
+                shard.reload_collection_if_changed()
+                if config["compact_dim"] > 0:
+                    if shard.compact_index is None:
+                        if shard.load_compact_index():
+                            shard.collection = None  # Served by the compact index
+                    else:
+                        shard.compact_index.reload_if_changed(shard.client)
+                if shard.lexical_index is None:
+                    shard.load_lexical_index()
+                else:
+                    shard.lexical_index.reload_if_changed()
+        finally:
+            # Even after a failed reload, keep what is served from retirement
+            self.acknowledge()
+        self.sizes = self.counts()
+
+    def _select(self, catalogs: Optional[List[str]]) -> List[str]:
+        """
+        Targeted shards (all when `catalogs` is empty), leaving out the ones
+        empty at the last size refresh. ValueError if a catalog is unknown.
+        """
+        if not catalogs:
+            catalogs = list(self.shards)
+        unknown = [catalog for catalog in catalogs if catalog not in self.shards]
+        if unknown:
+            raise ValueError(f"Unknown catalogs: {unknown}")
+        return [
+            catalog
+            for catalog in dict.fromkeys(catalogs)
+            if self.sizes.get(catalog, 1) > 0
+        ]
+
+    def _fan_out(
+        self, catalogs: List[str], query_vectors: numpy.ndarray, **kwargs
+    ) -> Dict[str, List[List[Dict[str, Any]]]]:
+        """Run search_vectors on each shard concurrently"""
+        if len(catalogs) == 1:
+            shard = self.shards[catalogs[0]]
+            return {catalogs[0]: shard.search_vectors(query_vectors, **kwargs)}
+        with timed(SEARCH_STAGE_SECONDS, "fan_out"):
+            futures = {
+                catalog: self.pool.submit(
+                    # Each task gets its own context, so stage timings still
+                    # land in the request's Server-Timing totals
+                    contextvars.copy_context().run,
+                    self.shards[catalog].search_vectors,
+                    query_vectors,
+                    **kwargs,
+                )
+                for catalog in catalogs
+            }
+            return {catalog: future.result() for catalog, future in futures.items()}
+
+    @staticmethod
+    def _merge(
+        per_shard: Dict[str, List[Dict[str, Any]]], top_k: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Top-k across shards, by the score each shard ranked its results by:
+        similarity in vector mode, fused score in hybrid mode (fusion scores
+        are on the same scale in every shard). Duplicates are collapsed within
+        each shard only: near-duplicate groups are built per collection, so
+        the same photo listed in two catalogs can appear twice.
+        """
+        ranked = []
+        for catalog, results in per_shard.items():
+            for rank, result in enumerate(results):
+                result["catalog"] = catalog
+                ranked.append(((-result.pop("score"), rank), result))
+        ranked.sort(key=lambda entry: entry[0])
+        return [result for _, result in ranked[:top_k]]
+
+    def search_vectors(
+        self,
+        query_vectors: numpy.ndarray,
+        top_k: int = 5,
+        collapse_duplicates: bool = True,
+        mode: str = "vector",
+        queries: Optional[List[str]] = None,
+        catalogs: Optional[List[str]] = None,
+        exclude_ids=(),
+    ) -> List[List[Dict[str, Any]]]:
+        """Merged results of encoded queries over the targeted shards"""
+        selected = self._select(catalogs)
+        per_shard = self._fan_out(
+            selected,
+            query_vectors,
+            top_k=top_k,
+            collapse_duplicates=collapse_duplicates,
+            mode=mode,
+            queries=queries,
+            exclude_ids=exclude_ids,
+            with_scores=True,
+        )
+        return [
+            self._merge(
+                {catalog: results[i] for catalog, results in per_shard.items()},
+                top_k,
+            )
+            for i in range(len(query_vectors))
+        ]
+
+    def search_similar(
+        self,
+        query: str,
+        top_k: int = 5,
+        collapse_duplicates: bool = True,
+        mode: str = config["search_mode"],
+        catalogs: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Text search over the targeted shards (all by default)"""
+        query_vectors = self.encoder.encode_text([query])
+        return self.search_vectors(
+            query_vectors,
+            top_k,
+            collapse_duplicates,
+            mode,
+            queries=[query],
+            catalogs=catalogs,
+        )[0]
+
+    def search_similar_batch(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        collapse_duplicates: bool = True,
+        mode: str = config["search_mode"],
+        catalogs: Optional[List[str]] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """Several text searches with one batched forward pass"""
+        if not queries:
+            return []
+        query_vectors = self.encoder.encode_text(queries)
+        return self.search_vectors(
+            query_vectors,
+            top_k,
+            collapse_duplicates,
+            mode,
+            queries=queries,
+            catalogs=catalogs,
+        )
+
+    def search_by_image(
+        self,
+        image: Image.Image,
+        top_k: int = 5,
+        collapse_duplicates: bool = True,
+        catalogs: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Image search over the targeted shards (all by default)"""
+        query_vectors = self.encoder.encode_image([image])
+        return self.search_vectors(
+            query_vectors, top_k, collapse_duplicates, catalogs=catalogs
+        )[0]
+
+    def search_by_item(
+        self,
+        item_id: str,
+        top_k: int = 5,
+        collapse_duplicates: bool = True,
+        catalogs: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Neighbours of an indexed item, from whichever shard holds it.
+        Raises KeyError if no shard has the item.
+        """
+        for shard in self.shards.values():
+            item = shard.get_item(item_id)
+            if item is not None:
+                break
+        else:
+            raise KeyError(item_id)
+
+        exclude_ids = {item_id}
+        if collapse_duplicates:
+            exclude_ids.add(item["metadata"].get("dup_group", item_id))
+        return self.search_vectors(
+            item["embedding"][None, :],
+            top_k,
+            collapse_duplicates,
+            catalogs=catalogs,
+            exclude_ids=exclude_ids,
+        )[0]
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import chromadb
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lexical_index import LexicalIndex  # noqa: E402
+
+
+def make_collection(path, titles):
+    client = chromadb.PersistentClient(path=str(path))
+    collection = client.get_or_create_collection("vinted_tops_db")
+    collection.add(
+        ids=[str(i) for i in range(len(titles))],
+        embeddings=[[float(i), 1.0] for i in range(len(titles))],
+        metadatas=[{"title": title} for title in titles],
+    )
+    return collection
+
+
+def test_updated_documents_are_reindexed_without_merge(tmp_path):
+    collection = make_collection(tmp_path / "chroma", ["robe zara"] * 20)
+    index = LexicalIndex(path=str(tmp_path / "lexical"), max_segments=8)
+    index.sync(collection, page_size=8)
+
+    updated = ["0", "1", "2", "3"]
+    collection.update(ids=updated, metadatas=[{"title": "robe robe mango"}] * 4)
+    report = index.sync(collection, page_size=8)
+
+    assert report["updated"] == 4
+    assert not report["merged"]
+    assert len(index.segments) == 2
+    assert index.document_count == 20
+    assert index.document_frequency["robe"] == 20
+    assert index.document_frequency["zara"] == 16
+    # "robe" twice: with a positive idf the updated documents rank first
+    assert sorted(index.search("robe", 4)) == updated
+    assert sorted(index.search("mango", 10)) == updated
+    assert not set(index.search("zara", 20)) & set(updated)
+
+    reloaded = LexicalIndex(path=str(tmp_path / "lexical"))
+    assert reloaded.load()
+    assert sorted(reloaded.search("robe", 4)) == updated
@@ -0,0 +1,11 @@
+"""
+Vector helpers shared by ingestion, search and the compact index.
+"""
+
+import numpy
+
+
+def l2_normalize(vectors: numpy.ndarray) -> numpy.ndarray:
+    """Row-wise unit vectors, as float32"""
+    vectors = numpy.asarray(vectors, dtype=numpy.float32)
+    return vectors / (numpy.linalg.norm(vectors, axis=-1, keepdims=True) + 1e-12)
@@ -0,0 +1,109 @@
+"""
+Versioned artifacts shared by refresh jobs and the API.
+
+A refresh job builds a new version next to the one being served and
+switches a manifest to it atomically; API processes pick the new version
+up when the manifest changes. Each API process also records, in a small
+file of its own, which versions it is serving. A superseded version is
+only retired once the grace period has passed and no live API process
+reports serving it.
+"""
+
+import os
+import json
+import time
+import socket
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from config import get_config
+
+config = get_config()
+
+logger = logging.getLogger(__name__)
+
+
+def read_manifest(path: str) -> Optional[Dict[str, Any]]:
+    """Manifest at `path`, or None if there is none (or it is unreadable)"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(path: str, manifest: Dict[str, Any]) -> None:
+    """Swap the manifest in atomically, so readers never see half a file"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class ServingRegistry:
+    """Versions served by each live API process, for safe retirement"""
+
+    def __init__(
+        self,
+        path: str = config["serving_registry_path"],
+        ttl_seconds: float = config["serving_ack_ttl"],
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+
+    @property
+    def own_path(self) -> str:
+        return os.path.join(self.path, f"{socket.gethostname()}-{os.getpid()}.json")
+
+    def acknowledge(self, versions: Iterable[str]) -> None:
+        """Record the versions this process serves; call at least every TTL"""
+        write_manifest(
+            self.own_path,
+            {"updated_at": time.time(), "versions": sorted(set(versions))},
+        )
+
+    def release(self) -> None:
+        """Forget this process, e.g. on shutdown"""
+        try:
+            os.remove(self.own_path)
+        except OSError:
+            pass
+
+    def in_use(self) -> Set[str]:
+        """Versions acknowledged by processes seen within the TTL"""
+        versions: Set[str] = set()
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return versions
+        now = time.time()
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            ack = read_manifest(os.path.join(self.path, name))
+            if ack is None:
+                continue
+            if now - ack.get("updated_at", 0) > self.ttl_seconds:
+                # The process is gone; its file no longer protects anything
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+                continue
+            versions.update(ack.get("versions", []))
+        return versions
+
+    def retirable(self, superseded: Dict[str, float]) -> List[str]:
+        """
+        Superseded versions (name -> time it stopped being current) that
+        are past the grace period and that no live API process serves. The
+        grace period covers processes that have not acknowledged yet.
+        """
+        in_use = self.in_use()
+        cutoff = time.time() - self.ttl_seconds
+        return [
+            version
+            for version, superseded_at in superseded.items()
+            if superseded_at < cutoff and version not in in_use
+        ]
@@ -5,12 +5,23 @@ const API_BASE_URL = 'http://localhost:8000';
 // Alternative production URL (uncomment when deploying)
 // const API_BASE_URL = 'http://35.180.91.139:8000';
 
+// Search behaviour
+const SEARCH_TOP_K = 5;
+const SEARCH_DEBOUNCE_MS = 400;      // Wait after the last keystroke before searching
+const SEARCH_MIN_QUERY_LENGTH = 3;   // Shorter typed queries are not sent
+const SEARCH_CACHE_MAX_ENTRIES = 50;
+const SEARCH_CACHE_TTL_MS = 5 * 60 * 1000;
+
 class VintedFashionSearch {
     constructor() {
         this.isInitialized = false;
         this.searchOverlay = null;
         this.floatingButton = null;
         this.backendUrl = API_BASE_URL;
+        this.debounceTimer = null;
+        this.abortController = null;
+        // Query -> { results, storedAt, partial }, oldest first (Map keeps insertion order)
+        this.resultCache = new Map();
         
         this.init();
     }
@@ -107,15 +118,29 @@ class VintedFashionSearch {
         });
         
         searchSubmit.addEventListener('click', () => {
+            this.cancelDebounce();
             this.performSearch();
         });
         
         searchInput.addEventListener('keypress', (e) => {
             if (e.key === 'Enter') {
+                this.cancelDebounce();
                 this.performSearch();
             }
         });
         
+        // Search as the user types, once they pause
+        searchInput.addEventListener('input', () => {
+            this.cancelDebounce();
+            if (searchInput.value.trim().length < SEARCH_MIN_QUERY_LENGTH) {
+                return;
+            }
+            this.debounceTimer = setTimeout(() => {
+                this.debounceTimer = null;
+                this.performSearch({ partial: true });
+            }, SEARCH_DEBOUNCE_MS);
+        });
+        
         // Close on overlay click (but not on modal click)
         this.searchOverlay.addEventListener('click', (e) => {
             if (e.target === this.searchOverlay) {
@@ -140,10 +165,58 @@ class VintedFashionSearch {
     
     hideSearchOverlay() {
         this.searchOverlay.style.display = 'none';
+        this.cancelDebounce();
+        this.abortInFlightSearch();
+        this.hideLoading();
         this.clearResults();
     }
     
-    async performSearch() {
+    cancelDebounce() {
+        if (this.debounceTimer !== null) {
+            clearTimeout(this.debounceTimer);
+            this.debounceTimer = null;
+        }
+    }
+    
+    abortInFlightSearch() {
+        if (this.abortController) {
+            this.abortController.abort();
+            this.abortController = null;
+        }
+    }
+    
+    cacheKey(query) {
+        return `${query.toLowerCase().replace(/\s+/g, ' ')}|${SEARCH_TOP_K}`;
+    }
+    
+    getCachedResults(query, partial) {
+        const key = this.cacheKey(query);
+        const entry = this.resultCache.get(key);
+        if (!entry) return null;
+        // A submitted query is sent at least once so the backend counts it
+        if (entry.partial && !partial) return null;
+        if (Date.now() - entry.storedAt > SEARCH_CACHE_TTL_MS) {
+            this.resultCache.delete(key);
+            return null;
+        }
+        // Refresh recency
+        this.resultCache.delete(key);
+        this.resultCache.set(key, entry);
+        return entry.results;
+    }
+    
+    cacheResults(query, results, partial) {
+        const key = this.cacheKey(query);
+        this.resultCache.delete(key);
+        this.resultCache.set(key, { results, storedAt: Date.now(), partial });
+        while (this.resultCache.size > SEARCH_CACHE_MAX_ENTRIES) {
+            // Evict the least recently used entry
+            this.resultCache.delete(this.resultCache.keys().next().value);
+        }
+    }
+    
+    // partial: searched while typing, so the backend does not count the query
+    async performSearch({ partial = false } = {}) {
         const searchInput = this.searchOverlay.querySelector('#fashion-search-input');
         const query = searchInput.value.trim();
         
@@ -152,10 +225,23 @@ class VintedFashionSearch {
             return;
         }
         
-        this.showLoading();
+        // A newer search supersedes any request still in flight
+        this.abortInFlightSearch();
+        
         this.hideError();
         this.clearResults();
         
+        const cached = this.getCachedResults(query, partial);
+        if (cached) {
+            this.hideLoading();
+            this.displayResults(cached);
+            return;
+        }
+        
+        const controller = new AbortController();
+        this.abortController = controller;
+        this.showLoading();
+        
         try {
             const response = await fetch(`${this.backendUrl}/api/search`, {
                 method: 'POST',
@@ -165,22 +251,38 @@ class VintedFashionSearch {
                 },
                 body: JSON.stringify({
                     query: query,
-                    top_k: 5
-                })
+                    top_k: SEARCH_TOP_K,
+                    partial: partial
+                }),
+                signal: controller.signal
             });
             
+            if (controller.signal.aborted || this.abortController !== controller) {
+                return;  // Superseded while waiting for the response
+            }
             if (!response.ok) {
                 throw new Error(`HTTP ${response.status}: ${response.statusText}`);
             }
             
             const data = await response.json();
+            if (controller.signal.aborted || this.abortController !== controller) {
+                return;  // Superseded while the body was being read
+            }
+            this.cacheResults(query, data.results, partial);
             this.displayResults(data.results);
             
         } catch (error) {
+            if (error.name === 'AbortError') {
+                return;  // Superseded by a newer search
+            }
             this.showError(`Search failed: ${error.message}`);
             console.error('Search error:', error);
         } finally {
-            this.hideLoading();
+            // Only the latest search owns the loading state
+            if (this.abortController === controller) {
+                this.abortController = null;
+                this.hideLoading();
+            }
         }
     }
     